@@ -1 +1,2 @@
 from .amp_lib import AmpClient
+from .amp_async_lib import AsyncAmpClient
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import struct
+from io import BytesIO
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from PIL import Image
+
+from . import audio_extraction
+
+
+async def _run_blocking(func, *args) -> Any:
+    # File reads and audio extraction run in a thread, off the event loop
+    return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+def _read_file(file_path: str) -> bytes:
+    with open(file_path, "rb") as file:
+        return file.read()
+
+
+class AsyncAmpClient:
+    """Asynchronous counterpart of AmpClient for keeping many requests in flight.
+
+    Local files are read and audio is extracted in the event loop's default
+    executor, so they do not block other coroutines. Requires httpx
+    (pip install amp_lib[async]).
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:17173",
+        pool_size: int = 10,
+        timeout: Optional[float] = None,
+        retries: int = 3,
+    ):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError(
+                "AsyncAmpClient requires httpx. Install it with 'pip install httpx'."
+            )
+
+        self.base_url = base_url
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+        )
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncAmpClient":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def _post(
+        self,
+        endpoint: str,
+        json: Dict[str, Any] = None,
+        files: Dict[str, Any] = None,
+        data: Dict[str, Any] = None,
+        json_mode: bool = False,
+    ) -> Any:
+        response = await self.client.post(
+            f"/{endpoint}", json=json, files=files, data=data
+        )
+
+        if response.status_code != 200:
+            print(response.json())
+            return None
+
+        return response.json() if json_mode else response.text
+
+    async def _get(self, endpoint: str, params: Dict[str, Any] = None) -> Any:
+        response = await self.client.get(f"/{endpoint}", params=params)
+
+        if response.status_code != 200:
+            print(response.json())
+            return None
+
+        return response.text
+
+    async def add_system_message(self, conversation_id: str, message: str) -> str:
+        return await self._post(
+            "add_system_message",
+            {"conversation_id": conversation_id, "message": message},
+        )
+
+    async def add_user_message(self, conversation_id: str, message: str) -> str:
+        return await self._post(
+            "add_user_message", {"conversation_id": conversation_id, "message": message}
+        )
+
+    async def add_assistant_message(self, conversation_id: str, message: str) -> str:
+        return await self._post(
+            "add_assistant_message",
+            {"conversation_id": conversation_id, "message": message},
+        )
+
+    async def get_available_models(self) -> List[str]:
+        return await self._get("get_available_models")
+
+    async def get_model_info(self, conversation_id: str) -> Dict[str, Any]:
+        return await self._post(
+            "get_model_info", {"conversation_id": conversation_id}, json_mode=True
+        )
+
+    async def generate_response(
+        self,
+        conversation_id: str,
+        message: str,
+        max_tokens: int = 2000,
+        single_message_mode: bool = False,
+        response_prefix: str = "",
+    ) -> str:
+        data = {
+            "conversation_id": conversation_id,
+            "message": message,
+            "max_tokens": max_tokens,
+            "single_message_mode": single_message_mode,
+            "response_prefix": response_prefix,
+        }
+        return await self._post("generate_response", data)
+
+    async def speech_to_text(
+        self, audio_file_path: str, srt_mode: bool = False, extract_audio: bool = True
+    ) -> Dict[str, str]:
+        data = {"srt_mode": str(srt_mode)}
+        if extract_audio and audio_extraction.can_extract_audio(audio_file_path):
+            audio = await _run_blocking(audio_extraction.extract_audio, audio_file_path)
+            files = {"file": ("audio.ogg", audio)}
+            return await self._post("stt", files=files, data=data)
+
+        content = await _run_blocking(_read_file, audio_file_path)
+        files = {"file": (os.path.basename(audio_file_path), content)}
+        return await self._post("stt", files=files, data=data)
+
+    async def speech_to_text_stream(
+        self, audio_file_path: str, srt_mode: bool = False, extract_audio: bool = True
+    ) -> AsyncGenerator[str, None]:
+        async def read_chunks():
+            if extract_audio and audio_extraction.can_extract_audio(audio_file_path):
+                file = await _run_blocking(
+                    audio_extraction.extract_audio, audio_file_path
+                )
+            else:
+                file = await _run_blocking(open, audio_file_path, "rb")
+
+            with file:
+                chunk = await _run_blocking(file.read, 1024 * 1024)
+                while chunk:
+                    yield chunk
+                    chunk = await _run_blocking(file.read, 1024 * 1024)
+
+        async with self.client.stream(
+            "POST",
+            "/stt/stream",
+            params={"srt_mode": str(srt_mode)},
+            content=read_chunks(),
+            headers={"Content-Type": "application/octet-stream"},
+        ) as response:
+            if response.status_code != 200:
+                print(f"Error transcribing audio. status_code={response.status_code}")
+                return
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                payload = line[len("data: ") :]
+                if payload == "[DONE]":
+                    break
+                yield json.loads(payload)["text"]
+
+    async def text_to_speech(
+        self, text: str, clone_audio_file_path: str = None
+    ) -> AsyncGenerator[bytes, None]:
+        data = {"text": text}
+        files = {}
+        if clone_audio_file_path:
+            files["clone_audio"] = await _run_blocking(
+                _read_file, clone_audio_file_path
+            )
+
+        async with self.client.stream("POST", "/tts", data=data, files=files) as response:
+            if response.status_code != 200:
+                print(f"Error generating TTS. status_code={response.status_code}")
+                yield b""
+                return
+
+            buffer = b""
+            async for chunk in response.aiter_bytes():
+                buffer += chunk
+
+                # Each WAV file is prefixed with its size as a 4-byte integer
+                while len(buffer) >= 4:
+                    (size,) = struct.unpack("<I", buffer[:4])
+                    if len(buffer) < 4 + size:
+                        break
+                    yield buffer[4 : 4 + size]
+                    buffer = buffer[4 + size :]
+
+    async def generate_image(
+        self,
+        prompt: str,
+        width: int = 1024,
+        height: int = 1024,
+        seed: int = None,
+        image_format: str = "png",
+        quality: int = None,
+    ) -> Image.Image:
+        data = {
+            "prompt": prompt,
+            "width": width,
+            "height": height,
+            "seed": seed,
+            "output_format": image_format,
+            "quality": quality,
+        }
+        response = await self.client.post("/generate_image", json=data)
+
+        if response.status_code != 200:
+            print(response.json())
+            return None
+
+        # The image is sent as raw bytes in the requested format
+        return Image.open(BytesIO(response.content))
+
+    async def send_telegram_message(self, message: str) -> str:
+        return await self._post("telegram_message", {"message": message})
@@ -1,14 +1,47 @@
+import json
 import struct
 import requests
-import base64
-from typing import Dict, Any, Tuple, List, Generator
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Optional, Tuple, List, Generator
 from io import BytesIO
 from PIL import Image
 
+from . import audio_extraction
+
 
 class AmpClient:
-    def __init__(self, base_url: str = "http://localhost:17173"):
+    def __init__(
+        self,
+        base_url: str = "http://localhost:17173",
+        pool_size: int = 10,
+        timeout: Optional[float] = None,
+        retries: int = 3,
+    ):
         self.base_url = base_url
+        self.timeout = timeout
+
+        # Reuse keep-alive connections across calls, only connection errors are
+        # retried so requests that reached the server are never sent twice
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries, connect=retries, read=0, backoff_factor=0.1
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "AmpClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
     def _post(
         self,
@@ -18,8 +51,12 @@ class AmpClient:
         data: Dict[str, Any] = None,
         json_mode: bool = False,
     ) -> Any:
-        response = requests.post(
-            f"{self.base_url}/{endpoint}", json=json, files=files, data=data
+        response = self.session.post(
+            f"{self.base_url}/{endpoint}",
+            json=json,
+            files=files,
+            data=data,
+            timeout=self.timeout,
         )
 
         if response.status_code != 200:
@@ -29,7 +66,9 @@ class AmpClient:
         return response.json() if json_mode else response.text
 
     def _get(self, endpoint: str, params: Dict[str, Any] = None) -> Any:
-        response = requests.get(f"{self.base_url}/{endpoint}", params=params)
+        response = self.session.get(
+            f"{self.base_url}/{endpoint}", params=params, timeout=self.timeout
+        )
 
         if response.status_code != 200:
             print(response.json())
@@ -80,13 +119,60 @@ class AmpClient:
         return self._post("generate_response", data)
 
     def speech_to_text(
-        self, audio_file_path: str, srt_mode: bool = False
+        self, audio_file_path: str, srt_mode: bool = False, extract_audio: bool = True
     ) -> Dict[str, str]:
+        """Transcribes an audio or video file.
+
+        With extract_audio, only the audio track of a video is uploaded when
+        PyAV is installed (pip install amp_lib[media]), otherwise the whole file
+        is sent.
+        """
+        data = {"srt_mode": str(srt_mode)}
+        if extract_audio and audio_extraction.can_extract_audio(audio_file_path):
+            audio = audio_extraction.extract_audio(audio_file_path)
+            return self._post("stt", files={"file": ("audio.ogg", audio)}, data=data)
+
         with open(audio_file_path, "rb") as file:
             files = {"file": file}
-            data = {"srt_mode": str(srt_mode)}
             return self._post("stt", files=files, data=data)
 
+    def speech_to_text_stream(
+        self, audio_file_path: str, srt_mode: bool = False, extract_audio: bool = True
+    ) -> Generator[str, None, None]:
+        """Yields transcript pieces while the server is still transcribing.
+
+        The file is streamed as the raw request body, so the server starts
+        decoding before the upload has finished. Joining the pieces gives the
+        full transcript. Videos are reduced to their audio track as in
+        speech_to_text.
+        """
+        if extract_audio and audio_extraction.can_extract_audio(audio_file_path):
+            file = audio_extraction.extract_audio(audio_file_path)
+        else:
+            file = open(audio_file_path, "rb")
+
+        with file:
+            response = self.session.post(
+                f"{self.base_url}/stt/stream",
+                params={"srt_mode": str(srt_mode)},
+                data=file,
+                headers={"Content-Type": "application/octet-stream"},
+                stream=True,
+                timeout=self.timeout,
+            )
+
+            if response.status_code != 200:
+                print(response.json())
+                return
+
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                payload = line[len("data: ") :]
+                if payload == "[DONE]":
+                    break
+                yield json.loads(payload)["text"]
+
     def text_to_speech(
         self, text: str, clone_audio_file_path: str = None
     ) -> Generator[bytes, None, None]:
@@ -95,8 +181,12 @@ class AmpClient:
         if clone_audio_file_path:
             files["clone_audio"] = open(clone_audio_file_path, "rb")
 
-        response = requests.post(
-            f"{self.base_url}/tts", data=data, files=files, stream=True
+        response = self.session.post(
+            f"{self.base_url}/tts",
+            data=data,
+            files=files,
+            stream=True,
+            timeout=self.timeout,
         )
 
         if response.status_code != 200:
@@ -120,20 +210,32 @@ class AmpClient:
                 break  # In case the data stream is shorter than expected
 
     def generate_image(
-        self, prompt: str, width: int = 1024, height: int = 1024, seed: int = None
+        self,
+        prompt: str,
+        width: int = 1024,
+        height: int = 1024,
+        seed: int = None,
+        image_format: str = "png",
+        quality: int = None,
     ) -> Tuple[bool, Image.Image]:
-        data = {"prompt": prompt, "width": width, "height": height, "seed": seed}
-        response = requests.post(f"{self.base_url}/generate_image", json=data)
+        data = {
+            "prompt": prompt,
+            "width": width,
+            "height": height,
+            "seed": seed,
+            "output_format": image_format,
+            "quality": quality,
+        }
+        response = self.session.post(
+            f"{self.base_url}/generate_image", json=data, timeout=self.timeout
+        )
 
         if response.status_code != 200:
             print(response.json())
             return None
 
-        # Decode the base64-encoded string
-        image_data = base64.b64decode(response.text)
-
-        # Create an image from the decoded data
-        return Image.open(BytesIO(image_data))
+        # The image is sent as raw bytes in the requested format
+        return Image.open(BytesIO(response.content))
 
     def send_telegram_message(self, message: str) -> str:
         return self._post("telegram_message", {"message": message})
@@ -0,0 +1,52 @@
+import importlib.util
+import os
+from io import BytesIO
+
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".mov", ".avi", ".webm"}
+
+
+def is_video_file(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in VIDEO_EXTENSIONS
+
+
+def can_extract_audio(file_path: str) -> bool:
+    """Returns True for video files when PyAV is installed to extract their audio."""
+    return is_video_file(file_path) and importlib.util.find_spec("av") is not None
+
+
+def extract_audio(
+    file_path: str, sampling_rate: int = 16000, bit_rate: int = 32000
+) -> BytesIO:
+    """Extracts the audio track of a file as mono Opus audio in an Ogg container.
+
+    Speech at 16 kHz and 32 kbps is all Whisper needs, which makes the upload a
+    small fraction of the size of a video. Requires PyAV
+    (pip install amp_lib[media]).
+    """
+    import av
+
+    output = BytesIO()
+    with av.open(file_path) as input_container, av.open(
+        output, "w", format="ogg"
+    ) as output_container:
+        stream = output_container.add_stream("libopus", rate=sampling_rate)
+        stream.layout = "mono"
+        stream.bit_rate = bit_rate
+        resampler = av.audio.resampler.AudioResampler(
+            format="s16", layout="mono", rate=sampling_rate
+        )
+
+        # Only the audio track is decoded, video packets are skipped
+        for frame in input_container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                for packet in stream.encode(resampled):
+                    output_container.mux(packet)
+
+        for resampled in resampler.resample(None):
+            for packet in stream.encode(resampled):
+                output_container.mux(packet)
+        for packet in stream.encode(None):
+            output_container.mux(packet)
+
+    output.seek(0)
+    return output
@@ -8,6 +8,10 @@ setup(
         "requests",
         "Pillow",
     ],
+    extras_require={
+        "async": ["httpx"],
+        "media": ["av"],
+    },
     author="Aradrareness",
     author_email="",
     description="A client library for interacting with AMP services",
@@ -7,8 +7,11 @@
 # $ pip install optimum-quanto
 
 # This is a script to download the FLUX.1-schnell model from Hugging Face, quantize it (qint4 or qfloat8), and save it to the models folder.
+# The model is saved as a package in models/FLUX.1-schnell: the quantized transformer and T5 text encoder as safetensors,
+# the remaining components via save_pretrained and a manifest.json with the configs and quantization maps needed to load them.
 # In order to use this script, you need to have a GPU with at least 16GB of VRAM or more.
 
+import json
 import torch
 import os
 
@@ -23,7 +26,8 @@ if torch.cuda.is_available():
     print(f"Number of GPUs available: {torch.cuda.device_count()}")
 
 
-from optimum.quanto import freeze, qfloat8, quantize
+from optimum.quanto import freeze, qfloat8, quantization_map, quantize
+from safetensors.torch import save_file
 
 from diffusers import FlowMatchEulerDiscreteScheduler, AutoencoderKL
 from diffusers.models.transformers.transformer_flux import FluxTransformer2DModel
@@ -43,6 +47,49 @@ revision = "refs/pr/1"
 
 quantize_int4 = True
 
+PACKAGE_NAME = "FLUX.1-schnell"
+PACKAGE_FORMAT = 1
+
+
+def save_quantized_component(model, name, package_dir):
+    state_dict = {}
+    data_pointers = set()
+    for key, tensor in model.state_dict().items():
+        # safetensors refuses tensors that share memory, e.g. tied embeddings
+        if tensor.data_ptr() in data_pointers:
+            tensor = tensor.clone()
+        data_pointers.add(tensor.data_ptr())
+        state_dict[key] = tensor.contiguous()
+
+    weights = f"{name}.safetensors"
+    save_file(state_dict, os.path.join(package_dir, weights))
+
+    config = model.config
+    config = config.to_dict() if hasattr(config, "to_dict") else dict(config)
+    return {
+        "weights": weights,
+        "config": config,
+        "quantization_map": quantization_map(model),
+    }
+
+
+def save_pretrained_components(bfl_repo, revision, dtype, package_dir):
+    FlowMatchEulerDiscreteScheduler.from_pretrained(
+        bfl_repo, subfolder="scheduler", revision=revision
+    ).save_pretrained(os.path.join(package_dir, "scheduler"))
+    CLIPTokenizer.from_pretrained("openai/clip-vit-large-patch14").save_pretrained(
+        os.path.join(package_dir, "tokenizer")
+    )
+    T5TokenizerFast.from_pretrained(
+        bfl_repo, subfolder="tokenizer_2", revision=revision
+    ).save_pretrained(os.path.join(package_dir, "tokenizer_2"))
+    CLIPTextModel.from_pretrained(
+        "openai/clip-vit-large-patch14", torch_dtype=dtype
+    ).save_pretrained(os.path.join(package_dir, "text_encoder"))
+    AutoencoderKL.from_pretrained(
+        bfl_repo, subfolder="vae", torch_dtype=dtype, revision=revision
+    ).save_pretrained(os.path.join(package_dir, "vae"))
+
 
 def quantize_freeze_and_save_models(bfl_repo, revision, dtype):
     transformer = FluxTransformer2DModel.from_pretrained(
@@ -70,18 +117,35 @@ def quantize_freeze_and_save_models(bfl_repo, revision, dtype):
         quantize(text_encoder_2, weights=qfloat8)
     freeze(text_encoder_2)
 
-    # Create the "models" folder if it doesn't exist
+    # Create the package folder inside the "models" folder if it doesn't exist
     script_dir = os.path.dirname(os.path.abspath(__file__))
     models_dir = os.path.join(os.path.dirname(script_dir), "models")
-    os.makedirs(models_dir, exist_ok=True)
-
-    # Save the models in the "models" folder
-    torch.save(transformer, os.path.join(models_dir, "FLUX.1-schnell.pth"))
-    torch.save(
-        text_encoder_2, os.path.join(models_dir, "FLUX.1-schnell_text_encoder.pth")
-    )
-
-    print(f"Models saved in: {models_dir}")
+    package_dir = os.path.join(models_dir, PACKAGE_NAME)
+    os.makedirs(package_dir, exist_ok=True)
+
+    # Save the models in the package folder
+    components = {
+        "transformer": save_quantized_component(
+            transformer, "transformer", package_dir
+        ),
+        "text_encoder_2": save_quantized_component(
+            text_encoder_2, "text_encoder_2", package_dir
+        ),
+    }
+    save_pretrained_components(bfl_repo, revision, dtype, package_dir)
+
+    # The manifest is written last, so it only exists for complete packages
+    manifest = {
+        "format": PACKAGE_FORMAT,
+        "base_model": bfl_repo,
+        "revision": revision,
+        "dtype": str(dtype).replace("torch.", ""),
+        "components": components,
+    }
+    with open(os.path.join(package_dir, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    print(f"Models saved in: {package_dir}")
 
 
 if __name__ == "__main__":
@@ -1,18 +1,28 @@
+import logging
 import os
 import sys
+import threading
 import traceback
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Optional, Set, Tuple
 
 from amp.amp_manager.model_unloader import ModelUnloader
+from amp.amp_manager.request_scheduler import RequestScheduler
+from amp.amp_manager.resource_broker import ResourceBroker
+from amp.amp_manager.usage_tracker import UsageTracker
+from amp.audio.speech_to_text.audio_stream import extract_audio, hash_stream
 from amp.audio.speech_to_text.whisper_manager import WhisperManager
 from amp.audio.text_to_speech.xtts_manager import XttsManager
 from amp.image.image_generation.flux_manager import FluxManager
+from amp.language_models.api_model import ApiModel
+from amp.language_models.conversation_store import ConversationStore
 from amp.language_models.model_conversation import ModelConversation
 from amp.language_models.providers.llamacpp.llamacpp_manager import LlamaCppManager
 import uuid
 import time
 import json
 
+logger = logging.getLogger(__name__)
+
 
 class AmpManager:
     def __init__(self):
@@ -23,29 +33,101 @@ class AmpManager:
         self.flux_manager: FluxManager = FluxManager()
         self.gradio_port = 8080
         self.gradio_html_iframe = self.initialize_gradio_html()
-        self.conversations: Dict[str, ModelConversation] = {}
+        self.conversations = ConversationStore(
+            db_path=os.getenv("CONVERSATIONS.DB_PATH", "conversations.db"),
+            max_in_memory=int(os.getenv("CONVERSATIONS.MAX_IN_MEMORY", 256)),
+            ttl_seconds=int(os.getenv("CONVERSATIONS.TTL_SECONDS", 3600)),
+            retention_days=int(os.getenv("CONVERSATIONS.RETENTION_DAYS", 30)),
+        )
+        self.request_scheduler = RequestScheduler(
+            self.llamacpp_manager,
+            max_queue_size=int(os.getenv("LLAMACPP.MAX_QUEUED_REQUESTS", 16)),
+        )
 
-        self.llamacpp_unloader = ModelUnloader(
-            unload_callback=self.unload_llamacpp_model, unload_timeout=660
+        self.usage_tracker = UsageTracker(
+            min_timeout=float(os.getenv("UNLOAD.MIN_TIMEOUT", 60)),
+            max_timeout=float(os.getenv("UNLOAD.MAX_TIMEOUT", 3600)),
+        )
+        self.preload_enabled = os.getenv("PRELOAD.ENABLED", "true").lower() == "true"
+        self.preload_min_probability = float(
+            os.getenv("PRELOAD.MIN_PROBABILITY", 0.6)
         )
+        self.preloading: Set[str] = set()
+        self.preload_lock = threading.Lock()
+
+        self.resource_broker = ResourceBroker(self._get_memory_budget_mb())
+        self.resource_broker.register(
+            "whisper",
+            self.whisper_manager.estimate_memory_mb,
+            self.whisper_manager.model_is_loaded,
+            self.unload_whisper_model,
+            priority=2,
+        )
+        self.resource_broker.register(
+            "xtts",
+            self.xtts_manager.estimate_memory_mb,
+            self.xtts_manager.model_is_loaded,
+            self.unload_xtts_model,
+            priority=2,
+        )
+        self.resource_broker.register(
+            "flux",
+            self.flux_manager.estimate_memory_mb,
+            self.flux_manager.model_is_loaded,
+            self.unload_flux_model,
+            priority=1,
+        )
+
+        # One unloader per llama.cpp model, created on first use. Timers unload
+        # through the broker, which skips models that are still in use.
+        self.llamacpp_unloaders: Dict[str, ModelUnloader] = {}
         self.whisper_unloader = ModelUnloader(
-            unload_callback=self.unload_whisper_model, unload_timeout=600
+            unload_callback=lambda: self.resource_broker.unload_if_idle("whisper"),
+            unload_timeout=600,
         )
         self.xtts_unloader = ModelUnloader(
-            unload_callback=self.unload_xtts_model, unload_timeout=600
+            unload_callback=lambda: self.resource_broker.unload_if_idle("xtts"),
+            unload_timeout=600,
         )
         self.flux_unloader = ModelUnloader(
-            unload_callback=self.unload_flux_model, unload_timeout=60
+            unload_callback=lambda: self.resource_broker.unload_if_idle("flux"),
+            unload_timeout=60,
         )
 
     def get_available_models(self):
         return True, self.llamacpp_manager.get_available_models()
 
+    def get_model_status(self):
+        return True, self.llamacpp_manager.get_load_status()
+
+    def get_resource_allocation(self):
+        return True, self.resource_broker.get_allocation()
+
+    def get_transcription_cache_stats(self):
+        return True, self.whisper_manager.transcription_cache.get_statistics()
+
+    def get_tts_cache_stats(self):
+        return True, self.xtts_manager.audio_cache.get_statistics()
+
+    def get_prompt_cache_stats(self):
+        return True, self.flux_manager.prompt_cache.get_statistics()
+
+    def get_image_cache_stats(self):
+        return True, self.flux_manager.image_cache.get_statistics()
+
     def get_default_model(self):
         if not self.llamacpp_manager.get_available_models():
             raise ValueError("No models available.")
         return self.llamacpp_manager.get_available_models()[0]
 
+    def get_or_create_conversation(self, conversation_id: str) -> ModelConversation:
+        return self.conversations.get_or_create(
+            conversation_id, self._create_conversation
+        )
+
+    def _create_conversation(self) -> ModelConversation:
+        return ModelConversation(self.get_default_model())
+
     def add_system_message(self, data):
         return self.add_message(data, "system")
 
@@ -64,17 +146,15 @@ class AmpManager:
                 conversation_id, message
             )
 
-            if conversation_id not in self.conversations:
-                self.conversations[conversation_id] = ModelConversation(
-                    self.get_default_model()
-                )
-
-            if role == "user":
-                self.conversations[conversation_id].add_user_message(message)
-            elif role == "assistant":
-                self.conversations[conversation_id].add_assistant_message(message)
-            elif role == "system":
-                self.conversations[conversation_id].add_system_message(message)
+            with self.conversations.checkout(
+                conversation_id, self._create_conversation
+            ) as conversation:
+                if role == "user":
+                    conversation.add_user_message(message)
+                elif role == "assistant":
+                    conversation.add_assistant_message(message)
+                elif role == "system":
+                    conversation.add_system_message(message)
 
             return True, ""
 
@@ -84,8 +164,6 @@ class AmpManager:
 
     def generate_response(self, data):
         try:
-            self.llamacpp_unloader.cancel_unload_timer()
-
             conversation_id = data.get("conversation_id")
             user_message = data.get("message")
             max_tokens = data.get("max_tokens")
@@ -96,25 +174,31 @@ class AmpManager:
                 conversation_id, user_message
             )
 
-            if conversation_id not in self.conversations:
-                self.conversations[conversation_id] = ModelConversation(
-                    self.get_default_model()
-                )
-
-            self.conversations[conversation_id].add_user_message(user_message)
-
-            model_path = self.conversations[conversation_id].get_model_path()
-
-            self.llamacpp_manager.change_model(model_path)  # TODO: Improve this
-
-            response = self.conversations[conversation_id].generate_message(
-                self.llamacpp_manager.active_models[0],
-                max_tokens,
-                single_message_mode,
-                response_prefix=response_prefix,
-            )
+            with self.conversations.checkout(
+                conversation_id, self._create_conversation
+            ) as conversation:
+                conversation.add_user_message(user_message)
+
+                model_path = conversation.get_model_path()
+
+                llamacpp_unloader = self._get_llamacpp_unloader(model_path)
+                llamacpp_unloader.cancel_unload_timer()
+                self._record_usage(f"llamacpp:{model_path}")
+
+                self._reserve_llamacpp(model_path)
+                model = self.request_scheduler.acquire(model_path)
+                try:
+                    response = conversation.generate_message(
+                        model,
+                        max_tokens,
+                        single_message_mode,
+                        response_prefix=response_prefix,
+                        cache_key=conversation_id,
+                    )
+                finally:
+                    self.request_scheduler.release(model_path)
 
-            self.llamacpp_unloader.set_unload_timer()
+                self._set_unload_timer(f"llamacpp:{model_path}", llamacpp_unloader)
 
             return True, response
 
@@ -127,14 +211,9 @@ class AmpManager:
 
             conversation_id = self.validate_conversation_id(conversation_id)
 
-            if conversation_id not in self.conversations:
-                model_path = self.get_default_model()
-
-                if not model_path:
-                    raise ValueError("No model available.")
-                self.conversations[conversation_id] = ModelConversation(model_path)
-
-            model_path = self.conversations[conversation_id].get_model_path()
+            model_path = self.get_or_create_conversation(
+                conversation_id
+            ).get_model_path()
 
             return True, {"path": model_path}
 
@@ -230,20 +309,71 @@ class AmpManager:
         if not self._allowed_file(file.filename):
             return False, {"error_message": "Invalid file type"}
         if file:
-            self.whisper_unloader.cancel_unload_timer()
-
-            audio_content: str = file.read()
             srt_mode = request.form.get("srt_mode", "false").lower() == "true"
-            transcript = self.whisper_manager.transcribe(
-                audio_content, srt_mode=srt_mode
+            stream = request.form.get("stream", "false").lower() == "true"
+
+            # The upload is spooled to disk by the server, so it is hashed and
+            # decoded in pieces instead of being read into memory
+            md5_hash = hash_stream(file.stream)
+
+            # Cached transcripts are returned without loading Whisper
+            transcript = self.whisper_manager.get_cached_transcript(
+                md5_hash, srt_mode=srt_mode, streamed=stream
             )
+            if transcript is not None:
+                if stream:
+                    return True, (piece for piece in [transcript])
+                return True, transcript
+
+            if stream:
+                return self.speech_to_text_stream(file.stream, srt_mode, md5_hash)
+
+            # Only the mono 16 kHz audio track is kept for video uploads
+            audio = extract_audio(file.stream)
 
-            self.whisper_unloader.set_unload_timer()
+            self.whisper_unloader.cancel_unload_timer()
+            self._record_usage("whisper")
+
+            self.resource_broker.reserve("whisper")
+            with self.resource_broker.use("whisper"):
+                transcript = self.whisper_manager.transcribe(
+                    audio, srt_mode=srt_mode, md5_hash=md5_hash
+                )
+
+            self._set_unload_timer("whisper", self.whisper_unloader)
 
             return True, transcript
 
         return False, "No selected file"
 
+    def speech_to_text_stream(
+        self, audio_source, srt_mode: bool = False, md5_hash: Optional[str] = None
+    ):
+        """Returns a generator of transcript pieces for a file-like audio source."""
+        self.whisper_unloader.cancel_unload_timer()
+        self._record_usage("whisper")
+        self.resource_broker.reserve("whisper")
+
+        stream_generator = self._stream_transcript(audio_source, srt_mode, md5_hash)
+        # Start the generator so its cleanup runs even if the client
+        # disconnects before the first segment is sent
+        try:
+            first_piece = next(stream_generator)
+        except StopIteration:
+            return True, (piece for piece in [])
+        return True, self._prepend_chunk(first_piece, stream_generator)
+
+    def _stream_transcript(
+        self, audio_source, srt_mode: bool, md5_hash: Optional[str] = None
+    ):
+        try:
+            with self.resource_broker.use("whisper"):
+                yield from self.whisper_manager.transcribe_stream(
+                    audio_source, srt_mode=srt_mode, md5_hash=md5_hash
+                )
+        finally:
+            self._set_unload_timer("whisper", self.whisper_unloader)
+
     def _allowed_file(self, filename: Optional[str]) -> bool:
         if filename:
             return "." in filename and filename.rsplit(".", 1)[1].lower() in [
@@ -251,6 +381,11 @@ class AmpManager:
                 "mp3",
                 "mp4",
                 "mkv",
+                "flac",
+                "ogg",
+                "opus",
+                "m4a",
+                "webm",
             ]
         else:
             return False
@@ -259,34 +394,124 @@ class AmpManager:
         self, text: str, clone_audio_data: Optional[bytes] = None
     ):
         self.xtts_unloader.cancel_unload_timer()
-        wav_files = self.xtts_manager.text_to_speech_with_split(text, clone_audio_data)
-        self.xtts_unloader.set_unload_timer()
-        return wav_files
+        self._record_usage("xtts")
+        self.resource_broker.reserve("xtts")
+        wav_files = self._use_while_iterating(
+            "xtts",
+            self.xtts_manager.text_to_speech_with_split(text, clone_audio_data),
+            self.xtts_unloader,
+        )
+        # Start the generator so the model is marked as in use right away and
+        # the unload timer is armed even if the client disconnects early
+        try:
+            first_wav = next(wav_files)
+        except StopIteration:
+            return (wav for wav in [])
+        return self._prepend_chunk(first_wav, wav_files)
+
+    def _use_while_iterating(self, resource: str, iterator, unloader: ModelUnloader):
+        # Generators run lazily, so the resource is in use until iteration ends
+        try:
+            with self.resource_broker.use(resource):
+                yield from iterator
+        finally:
+            self._set_unload_timer(resource, unloader)
 
     def generate_image(self, prompt, width, height, guidance_scale=None, seed=None):
+        result, response = self.generate_images(
+            [prompt], width, height, guidance_scale, [seed]
+        )
+        if not result:
+            return False, response
+
+        image, _seed = response[0]
+        return True, image
+
+    def generate_images(
+        self,
+        prompts,
+        width,
+        height,
+        guidance_scale=None,
+        seeds=None,
+        num_images_per_prompt=1,
+    ):
+        """Returns a list of (image, seed) for num_images_per_prompt per prompt."""
         try:
+            # Cached seeded requests are served without loading FLUX
+            images = self.flux_manager.get_cached_images(
+                prompts, width, height, guidance_scale, seeds, num_images_per_prompt
+            )
+            if images is not None:
+                return True, images
+
             self.flux_unloader.cancel_unload_timer()
+            self._record_usage("flux")
+
+            self.resource_broker.reserve("flux")
+            with self.resource_broker.use("flux"):
+                images = self.flux_manager.generate_images(
+                    prompts,
+                    width,
+                    height,
+                    guidance_scale,
+                    seeds,
+                    num_images_per_prompt=num_images_per_prompt,
+                )
 
-            image = self.flux_manager.generate_image(
-                prompt, width, height, guidance_scale, seed
+            self._set_unload_timer("flux", self.flux_unloader)
+
+            return True, images
+
+        except Exception as e:
+            traceback.print_exc()
+            return False, str(e)
+
+    def generate_image_stream(
+        self, prompt, width, height, guidance_scale=None, seed=None
+    ):
+        """Returns a generator of preview events followed by the final image."""
+        try:
+            images = self.flux_manager.get_cached_images(
+                [prompt], width, height, guidance_scale, [seed]
             )
+            if images is not None:
+                image, seed = images[0]
+                return True, (event for event in [("image", image, seed)])
 
-            self.flux_unloader.set_unload_timer()
+            self.flux_unloader.cancel_unload_timer()
+            self._record_usage("flux")
+            self.resource_broker.reserve("flux")
 
-            return True, image
+            stream_generator = self._stream_image(
+                prompt, width, height, guidance_scale, seed
+            )
+            # Start the generator so its cleanup runs even if the client
+            # disconnects before the first preview is sent
+            first_event = next(stream_generator, None)
+            if first_event is None:
+                return False, "No image was generated"
+            return True, self._prepend_chunk(first_event, stream_generator)
 
         except Exception as e:
             traceback.print_exc()
             return False, str(e)
 
+    def _stream_image(self, prompt, width, height, guidance_scale=None, seed=None):
+        try:
+            with self.resource_broker.use("flux"):
+                yield from self.flux_manager.generate_image_stream(
+                    prompt, width, height, guidance_scale, seed
+                )
+        finally:
+            self._set_unload_timer("flux", self.flux_unloader)
+
     def chat_completions(self, data: Dict[str, Any]) -> Tuple[bool, Any]:
         """
         Handles chat completions in an OpenAI-compatible manner with support for multiple messages.
         Creates a new conversation each time the method is called.
         """
         try:
-            self.llamacpp_unloader.cancel_unload_timer()
-
             if not data:
                 return False, {"error": "Invalid JSON payload"}
 
@@ -312,6 +537,10 @@ class AmpManager:
             temperature = data.get("temperature", 0.7)
             stream = data.get("stream", False)
 
+            llamacpp_unloader = self._get_llamacpp_unloader(model_path)
+            llamacpp_unloader.cancel_unload_timer()
+            self._record_usage(f"llamacpp:{model_path}")
+
             # Initialize a new conversation with the selected model
             conversation = ModelConversation(model_path)
 
@@ -327,34 +556,42 @@ class AmpManager:
                     elif role.lower() == "system":
                         conversation.add_system_message(content)
 
-            self.llamacpp_manager.change_model(model_path)
+            self._reserve_llamacpp(model_path)
+            model = self.request_scheduler.acquire(model_path)
 
-            # Generate a response using the conversation history
-            response_text = conversation.generate_message(
-                model=self.llamacpp_manager.active_models[0],
-                max_tokens=max_tokens,
-                single_message_mode=False,  # Support multiple messages
-                response_prefix="",
-            )
-
-            # Optionally handle streaming responses
             if stream:
-                # TODO: Implement real streaming
-                def _resp_generator(resp_content: str):
-                    tokens = resp_content.split(" ")
-                    for token in tokens:
-                        chunk = {
-                            "id": str(uuid.uuid4()),
-                            "object": "chat.completion.chunk",
-                            "created": int(time.time()),
-                            "model": model_path,
-                            "choices": [{"delta": {"content": token + " "}}],
-                        }
-                        yield f"data: {json.dumps(chunk)}\n\n"
-                        time.sleep(0.5)  # Adjust sleep for desired streaming speed
-                    yield "data: [DONE]\n\n"
-
-                return True, _resp_generator(response_text)
+                stream_generator = self._stream_chat_completion(
+                    conversation,
+                    model,
+                    model_path,
+                    max_tokens,
+                )
+                # Start the generator so its cleanup runs even if the client
+                # disconnects before the first chunk is sent
+                first_chunk = next(stream_generator)
+                return True, self._prepend_chunk(first_chunk, stream_generator)
+
+            try:
+                # Generate a response using the conversation history
+                model_response = conversation.generate_response(
+                    model=model,
+                    max_tokens=max_tokens,
+                    single_message_mode=False,  # Support multiple messages
+                    response_prefix="",
+                )
+                response_text = model_response.get_text()
+
+                prompt_tokens = model_response.get_prompt_tokens()
+                if prompt_tokens is None:
+                    prompt_tokens = sum(
+                        model.count_tokens(msg.get("content", "")) for msg in messages
+                    )
+
+                completion_tokens = model_response.get_completion_tokens()
+                if completion_tokens is None:
+                    completion_tokens = model.count_tokens(response_text)
+            finally:
+                self.request_scheduler.release(model_path)
 
             # Construct the OpenAI-compatible response
             response = {
@@ -369,19 +606,13 @@ class AmpManager:
                         "index": 0,
                     }
                 ],
-                # TODO: Implement correct token counting
                 "usage": {
-                    "prompt_tokens": sum(
-                        len(msg.get("content", "").split()) for msg in messages
-                    ),
-                    "completion_tokens": len(response_text.split()),
-                    "total_tokens": sum(
-                        len(msg.get("content", "").split()) for msg in messages
-                    )
-                    + len(response_text.split()),
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
                 },
             }
-            self.llamacpp_unloader.set_unload_timer()
+            self._set_unload_timer(f"llamacpp:{model_path}", llamacpp_unloader)
 
             return True, response
 
@@ -389,6 +620,163 @@ class AmpManager:
             traceback.print_exc()
             return False, {"error": str(e)}
 
+    def _stream_chat_completion(
+        self,
+        conversation: ModelConversation,
+        model: ApiModel,
+        model_path: str,
+        max_tokens: int,
+    ):
+        completion_id = str(uuid.uuid4())
+        created = int(time.time())
+
+        def _chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model_path,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        try:
+            yield _chunk({"role": "assistant"})
+
+            for content in conversation.generate_message_stream(
+                model=model,
+                max_tokens=max_tokens,
+                single_message_mode=False,
+                response_prefix="",
+            ):
+                yield _chunk({"content": content})
+
+            yield _chunk({}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+        finally:
+            self.request_scheduler.release(model_path)
+            self._set_unload_timer(
+                f"llamacpp:{model_path}", self._get_llamacpp_unloader(model_path)
+            )
+
+    def _prepend_chunk(self, first_chunk: str, stream_generator):
+        yield first_chunk
+        yield from stream_generator
+
+    def _get_llamacpp_unloader(self, model_path: str) -> ModelUnloader:
+        if model_path not in self.llamacpp_unloaders:
+            resource = self._register_llamacpp(model_path)
+            self.llamacpp_unloaders[model_path] = ModelUnloader(
+                unload_callback=lambda: self.resource_broker.unload_if_idle(resource),
+                unload_timeout=660,
+            )
+        return self.llamacpp_unloaders[model_path]
+
+    def _get_memory_budget_mb(self) -> int:
+        budget_mb = int(os.getenv("RESOURCES.BUDGET_MB", 0))
+        if budget_mb != 0:
+            return max(budget_mb, 0)
+
+        # Default to most of the GPU memory when it can be detected
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                total = torch.cuda.get_device_properties(0).total_memory
+                return int(total * 0.9) // (1024 * 1024)
+        except ImportError:
+            pass
+        return 0
+
+    def _reserve_llamacpp(self, model_path: str) -> None:
+        self.resource_broker.reserve(self._register_llamacpp(model_path))
+
+    def _register_llamacpp(self, model_path: str) -> str:
+        resource = f"llamacpp:{model_path}"
+        if not self.resource_broker.is_registered(resource):
+            self.resource_broker.register(
+                resource,
+                lambda: self.llamacpp_manager.get_model_size_mb(model_path),
+                lambda: model_path in self.llamacpp_manager.loads,
+                # Never waits for in-flight requests under the broker lock
+                lambda: self.llamacpp_manager.unload_if_idle(model_path),
+                priority=3,
+                is_idle=lambda: self.request_scheduler.is_idle(model_path),
+            )
+        return resource
+
+    def _set_unload_timer(self, resource: str, unloader: ModelUnloader) -> None:
+        unloader.set_unload_timer(
+            self.usage_tracker.get_unload_timeout(resource, unloader.unload_timeout)
+        )
+
+    def _record_usage(self, resource: str) -> None:
+        self.usage_tracker.record(resource)
+
+        if not self.preload_enabled:
+            return
+
+        prediction = self.usage_tracker.predict_next(resource)
+        if not prediction or prediction[1] < self.preload_min_probability:
+            return
+
+        next_resource = prediction[0]
+        with self.preload_lock:
+            if next_resource in self.preloading or self._is_loaded_or_loading(
+                next_resource
+            ):
+                return
+            self.preloading.add(next_resource)
+
+        threading.Thread(
+            target=self._preload, args=(next_resource, resource), daemon=True
+        ).start()
+
+    def _is_loaded_or_loading(self, resource: str) -> bool:
+        if resource.startswith("llamacpp:"):
+            return resource[len("llamacpp:") :] in self.llamacpp_manager.loads
+
+        managers = {
+            "whisper": self.whisper_manager,
+            "xtts": self.xtts_manager,
+            "flux": self.flux_manager,
+        }
+        # Unknown resources are treated as loaded so they are never preloaded
+        return resource not in managers or managers[resource].model_is_loaded()
+
+    def _preload(self, next_resource: str, resource: str) -> None:
+        try:
+            if next_resource.startswith("llamacpp:"):
+                model_path = next_resource[len("llamacpp:") :]
+                if not self.resource_broker.fits(self._register_llamacpp(model_path)):
+                    return
+                if self.llamacpp_manager.preload_model(model_path):
+                    logger.info(f"Preloading {next_resource} after {resource}")
+                    self._set_unload_timer(
+                        next_resource, self._get_llamacpp_unloader(model_path)
+                    )
+                return
+
+            managers = {
+                "whisper": (self.whisper_manager, self.whisper_unloader),
+                "xtts": (self.xtts_manager, self.xtts_unloader),
+                "flux": (self.flux_manager, self.flux_unloader),
+            }
+            manager, unloader = managers[next_resource]
+            if not self.resource_broker.fits(next_resource):
+                return
+            if not manager.model_is_loaded():
+                logger.info(f"Preloading {next_resource} after {resource}")
+                manager.load_model()
+                self._set_unload_timer(next_resource, unloader)
+        except Exception:
+            logger.exception(f"Preloading {next_resource} failed")
+        finally:
+            with self.preload_lock:
+                self.preloading.discard(next_resource)
+
     def unload_llamacpp_model(self):
         self.llamacpp_manager.unload_model()
 
@@ -1,5 +1,5 @@
 import threading
-from typing import Callable
+from typing import Callable, Optional
 
 
 class ModelUnloader:
@@ -8,10 +8,12 @@ class ModelUnloader:
         self.unload_timeout = unload_timeout
         self.unload_timer = None
 
-    def set_unload_timer(self):
+    def set_unload_timer(self, unload_timeout: Optional[float] = None):
         if self.unload_timer:
             self.unload_timer.cancel()
-        self.unload_timer = threading.Timer(self.unload_timeout, self.unload_callback)
+        if unload_timeout is None:
+            unload_timeout = self.unload_timeout
+        self.unload_timer = threading.Timer(unload_timeout, self.unload_callback)
         self.unload_timer.start()
 
     def cancel_unload_timer(self):
@@ -0,0 +1,88 @@
+import logging
+import threading
+from typing import Dict
+
+from amp.language_models.api_model import ApiModel
+from amp.language_models.providers.llamacpp.llamacpp_manager import LlamaCppManager
+
+logger = logging.getLogger(__name__)
+
+
+class RequestScheduler:
+    """Admits llama.cpp requests per model and limits them to the server's slots.
+
+    A request pins its model while it is queued or decoding, and the
+    LlamaCppManager will not evict a pinned model until its work has drained.
+    """
+
+    def __init__(self, llamacpp_manager: LlamaCppManager, max_queue_size: int = 16):
+        self.llamacpp_manager = llamacpp_manager
+        self.max_queue_size = max_queue_size
+        self.condition = threading.Condition()
+        self.in_flight: Dict[str, int] = {}
+        self.slots: Dict[str, threading.BoundedSemaphore] = {}
+
+        self.llamacpp_manager.eviction_guard = self
+
+    def acquire(self, model_path: str) -> ApiModel:
+        slot_count = self.llamacpp_manager.parallel_slots
+
+        if (
+            model_path not in self.llamacpp_manager.loads
+            and model_path not in self.llamacpp_manager.get_available_models()
+        ):
+            raise ValueError(f"Model {model_path} not found.")
+
+        # Requesting and pinning happen under the manager lock, so a model cannot
+        # be evicted between being selected and being marked as in use.
+        with self.llamacpp_manager.lock:
+            with self.condition:
+                queued = self.in_flight.get(model_path, 0)
+                if queued >= slot_count + self.max_queue_size:
+                    raise RuntimeError(f"Request queue for {model_path} is full.")
+
+            model_future = self.llamacpp_manager.request_model(model_path)
+
+            with self.condition:
+                self.in_flight[model_path] = self.in_flight.get(model_path, 0) + 1
+                if model_path not in self.slots:
+                    self.slots[model_path] = threading.BoundedSemaphore(slot_count)
+                slot = self.slots[model_path]
+
+        # Wait for the model outside the lock, so requests for other models
+        # are not held up while it loads
+        try:
+            model = model_future.result(timeout=self.llamacpp_manager.load_timeout)
+        except Exception:
+            self._unpin(model_path)
+            raise
+
+        slot.acquire()
+        return model
+
+    def release(self, model_path: str) -> None:
+        with self.condition:
+            self.slots[model_path].release()
+        self._unpin(model_path)
+
+    def _unpin(self, model_path: str) -> None:
+        with self.condition:
+            self.in_flight[model_path] -= 1
+            if self.in_flight[model_path] == 0:
+                del self.in_flight[model_path]
+                del self.slots[model_path]
+            self.condition.notify_all()
+
+    def is_idle(self, model_path: str) -> bool:
+        with self.condition:
+            return self.in_flight.get(model_path, 0) == 0
+
+    def wait_until_idle(self, model_path: str) -> None:
+        with self.condition:
+            if self.in_flight.get(model_path, 0):
+                logger.info(f"Waiting for in-flight requests on {model_path} to finish")
+            self.condition.wait_for(lambda: self.in_flight.get(model_path, 0) == 0)
+
+    def get_in_flight_count(self, model_path: str) -> int:
+        with self.condition:
+            return self.in_flight.get(model_path, 0)
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ManagedResource:
+    def __init__(
+        self,
+        name: str,
+        estimate_mb: Callable[[], int],
+        is_loaded: Callable[[], bool],
+        unload: Callable[[], None],
+        priority: int,
+        is_idle: Optional[Callable[[], bool]] = None,
+    ):
+        self.name = name
+        self.estimate_mb = estimate_mb
+        self.is_loaded = is_loaded
+        self.unload = unload
+        self.priority = priority
+        self.is_idle = is_idle
+        self.in_use = 0
+        self.last_used = 0.0
+
+    def can_evict(self) -> bool:
+        if self.in_use > 0:
+            return False
+        return self.is_idle() if self.is_idle else True
+
+
+class ResourceBroker:
+    """Keeps the combined memory estimate of all loaded models within a budget.
+
+    Before a model is loaded, other loaded models are unloaded until the new
+    one fits, lowest priority first and least recently used among equals.
+    Models that are in use are never evicted.
+    """
+
+    def __init__(self, budget_mb: int = 0):
+        self.budget_mb = budget_mb
+        self.resources: Dict[str, ManagedResource] = {}
+        self.lock = threading.RLock()
+
+    def register(
+        self,
+        name: str,
+        estimate_mb: Callable[[], int],
+        is_loaded: Callable[[], bool],
+        unload: Callable[[], None],
+        priority: int = 0,
+        is_idle: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        with self.lock:
+            self.resources[name] = ManagedResource(
+                name, estimate_mb, is_loaded, unload, priority, is_idle
+            )
+
+    def is_registered(self, name: str) -> bool:
+        return name in self.resources
+
+    def reserve(self, name: str) -> None:
+        """Makes room for resource name before it is loaded or used."""
+        with self.lock:
+            resource = self.resources[name]
+            resource.last_used = time.time()
+
+            if self.budget_mb <= 0 or resource.is_loaded():
+                return
+
+            required_mb = resource.estimate_mb()
+            evicted = {name}
+            while self.get_used_mb() + required_mb > self.budget_mb:
+                victim = self._find_victim(exclude=evicted)
+                if victim is None:
+                    logger.warning(
+                        f"Loading {name} ({required_mb} MB) exceeds the memory budget "
+                        f"of {self.budget_mb} MB, but nothing can be evicted"
+                    )
+                    return
+
+                logger.info(f"Unloading {victim.name} to make room for {name}")
+                evicted.add(victim.name)
+                victim.unload()
+
+    def unload_if_idle(self, name: str) -> bool:
+        """Unloads resource name unless it is in use, e.g. when a timer expires."""
+        with self.lock:
+            resource = self.resources[name]
+            if not resource.is_loaded() or not resource.can_evict():
+                return False
+
+            logger.info(f"Unloading idle {name}")
+            resource.unload()
+            return True
+
+    def fits(self, name: str) -> bool:
+        """Whether resource name can be loaded without evicting anything."""
+        with self.lock:
+            resource = self.resources[name]
+            if self.budget_mb <= 0 or resource.is_loaded():
+                return True
+            return self.get_used_mb() + resource.estimate_mb() <= self.budget_mb
+
+    @contextmanager
+    def use(self, name: str):
+        """Marks resource name as in use so it is not evicted meanwhile."""
+        with self.lock:
+            resource = self.resources[name]
+            resource.in_use += 1
+            resource.last_used = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                resource.in_use -= 1
+                resource.last_used = time.time()
+
+    def get_used_mb(self) -> int:
+        with self.lock:
+            return sum(
+                resource.estimate_mb()
+                for resource in self.resources.values()
+                if resource.is_loaded()
+            )
+
+    def get_allocation(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "budget_mb": self.budget_mb,
+                "used_mb": self.get_used_mb(),
+                "resources": {
+                    resource.name: {
+                        "loaded": resource.is_loaded(),
+                        "estimated_mb": resource.estimate_mb(),
+                        "priority": resource.priority,
+                        "in_use": resource.in_use,
+                        "last_used": resource.last_used,
+                    }
+                    for resource in self.resources.values()
+                },
+            }
+
+    def _find_victim(self, exclude: Set[str]) -> Optional[ManagedResource]:
+        candidates = [
+            resource
+            for resource in self.resources.values()
+            if resource.name not in exclude
+            and resource.is_loaded()
+            and resource.can_evict()
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda r: (r.priority, r.last_used))
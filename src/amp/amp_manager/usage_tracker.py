@@ -0,0 +1,84 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class UsageTracker:
+    """Learns request patterns per model to tune unload timers and preloading.
+
+    For every resource it keeps an exponentially weighted average of the gap
+    between requests, and it counts which resource tends to be requested after
+    which, so the likely next model can be loaded ahead of time.
+    """
+
+    def __init__(
+        self,
+        smoothing: float = 0.3,
+        timeout_multiplier: float = 3.0,
+        min_timeout: float = 60,
+        max_timeout: float = 3600,
+        min_observations: int = 3,
+    ):
+        self.smoothing = smoothing
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_observations = min_observations
+        self.lock = threading.Lock()
+        self.last_seen: Dict[str, float] = {}
+        self.average_gap: Dict[str, float] = {}
+        self.observations: Dict[str, int] = {}
+        self.transitions: Dict[str, Dict[str, int]] = {}
+        self.last_resource: Optional[str] = None
+
+    def record(self, resource: str) -> None:
+        now = time.time()
+        with self.lock:
+            if resource in self.last_seen:
+                gap = now - self.last_seen[resource]
+                if resource in self.average_gap:
+                    self.average_gap[resource] += self.smoothing * (
+                        gap - self.average_gap[resource]
+                    )
+                else:
+                    self.average_gap[resource] = gap
+                self.observations[resource] = self.observations.get(resource, 0) + 1
+            self.last_seen[resource] = now
+
+            if self.last_resource is not None and self.last_resource != resource:
+                followers = self.transitions.setdefault(self.last_resource, {})
+                followers[resource] = followers.get(resource, 0) + 1
+            self.last_resource = resource
+
+    def get_unload_timeout(self, resource: str, default_timeout: float) -> float:
+        """Keeps a model loaded for a few typical gaps between its requests."""
+        with self.lock:
+            if self.observations.get(resource, 0) < self.min_observations:
+                return default_timeout
+
+            timeout = self.timeout_multiplier * self.average_gap[resource]
+            return max(self.min_timeout, min(self.max_timeout, timeout))
+
+    def predict_next(self, resource: str) -> Optional[Tuple[str, float]]:
+        """Returns the resource most often requested after resource and its share."""
+        with self.lock:
+            followers = self.transitions.get(resource)
+            if not followers:
+                return None
+
+            total = sum(followers.values())
+            if total < self.min_observations:
+                return None
+
+            next_resource = max(followers, key=lambda name: followers[name])
+            return next_resource, followers[next_resource] / total
+
+    def get_statistics(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {
+                resource: {
+                    "average_gap": round(self.average_gap.get(resource, 0), 1),
+                    "observations": self.observations.get(resource, 0),
+                }
+                for resource in self.last_seen
+            }
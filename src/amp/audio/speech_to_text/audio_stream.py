@@ -0,0 +1,99 @@
+import hashlib
+import itertools
+from typing import BinaryIO, Iterator, Tuple
+
+import av
+import numpy as np
+
+
+class HashingReader:
+    """File-like wrapper that computes the MD5 of everything read through it."""
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = 1024 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.md5 = hashlib.md5()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.md5.update(data)
+        return data
+
+    def seekable(self) -> bool:
+        return False
+
+    def read_remaining(self) -> None:
+        while self.read(self.chunk_size):
+            pass
+
+    def hexdigest(self) -> str:
+        return self.md5.hexdigest()
+
+
+def decode_audio_windows(
+    source: BinaryIO, window_seconds: float = 30, sampling_rate: int = 16000
+) -> Iterator[Tuple[float, np.ndarray]]:
+    """Decodes audio incrementally into mono windows of window_seconds.
+
+    Yields the start of each window in seconds and its samples as float32.
+    Decoding only reads as much of source as it needs, so windows can be
+    processed while the rest of a streamed upload is still arriving. A source
+    that cannot seek must be streamable, e.g. WAV, MP3, FLAC, OGG or MKV, not
+    an MP4 with its index at the end.
+    """
+    window_size = int(window_seconds * sampling_rate)
+    resampler = av.audio.resampler.AudioResampler(
+        format="s16", layout="mono", rate=sampling_rate
+    )
+    chunks = []
+    buffered = 0
+    offset = 0
+
+    with av.open(source, mode="r", metadata_errors="ignore") as container:
+        frames = container.decode(audio=0)
+        # Passing None flushes the samples the resampler still holds
+        for frame in itertools.chain(frames, [None]):
+            for resampled in resampler.resample(frame):
+                samples = resampled.to_ndarray().reshape(-1)
+                chunks.append(samples.astype(np.float32) / 32768.0)
+                buffered += samples.shape[0]
+
+            if buffered >= window_size:
+                buffer = np.concatenate(chunks)
+                while buffer.shape[0] >= window_size:
+                    yield offset / sampling_rate, buffer[:window_size]
+                    buffer = buffer[window_size:]
+                    offset += window_size
+                chunks = [buffer]
+                buffered = buffer.shape[0]
+
+    if buffered > 0:
+        yield offset / sampling_rate, np.concatenate(chunks)
+
+
+def extract_audio(source: BinaryIO, sampling_rate: int = 16000) -> np.ndarray:
+    """Decodes only the audio track of an audio or video file as mono float32.
+
+    Video streams are demuxed but never decoded, and source is read in pieces,
+    so a large upload spooled to disk is never held in memory as a whole.
+    """
+    windows = [
+        window
+        for _offset, window in decode_audio_windows(
+            source, window_seconds=600, sampling_rate=sampling_rate
+        )
+    ]
+    if not windows:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(windows)
+
+
+def hash_stream(stream: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the MD5 of a seekable stream and rewinds it."""
+    md5 = hashlib.md5()
+    chunk = stream.read(chunk_size)
+    while chunk:
+        md5.update(chunk)
+        chunk = stream.read(chunk_size)
+    stream.seek(0)
+    return md5.hexdigest()
@@ -0,0 +1,46 @@
+import bisect
+from typing import Dict, Iterable, List, NamedTuple
+
+
+class TranscriptSegment(NamedTuple):
+    start: float
+    end: float
+    text: str
+
+
+def merge_clips(clips: List[Dict[str, int]], max_samples: int) -> List[Dict[str, int]]:
+    """Merges consecutive VAD speech clips into chunks of at most max_samples.
+
+    A chunk spans from the start of its first clip to the end of its last,
+    like the chunks faster-whisper builds itself, so short fragments share a
+    30 second window instead of each being padded to one.
+    """
+    chunks: List[Dict[str, int]] = []
+    for clip in clips:
+        if chunks and clip["end"] - chunks[-1]["start"] <= max_samples:
+            chunks[-1]["end"] = clip["end"]
+        else:
+            chunks.append({"start": clip["start"], "end": clip["end"]})
+    return chunks
+
+
+def split_segments(
+    segments: Iterable, job_offsets: List[int], sampling_rate: int
+) -> List[List[TranscriptSegment]]:
+    """Assigns segments of concatenated audio to the jobs they came from.
+
+    job_offsets holds the first sample of every job. Each segment goes to the
+    job containing its midpoint and its times are made relative to that job.
+    """
+    job_starts = [offset / sampling_rate for offset in job_offsets]
+    job_segments: List[List[TranscriptSegment]] = [[] for _ in job_offsets]
+    for segment in segments:
+        middle = (segment.start + segment.end) / 2
+        index = max(bisect.bisect_right(job_starts, middle) - 1, 0)
+        job_start = job_starts[index]
+        job_segments[index].append(
+            TranscriptSegment(
+                segment.start - job_start, segment.end - job_start, segment.text
+            )
+        )
+    return job_segments
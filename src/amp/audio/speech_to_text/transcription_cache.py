@@ -0,0 +1,33 @@
+from typing import Any, Sequence
+
+from amp.cache.sqlite_lru_cache import SqliteLruCache
+
+
+class TranscriptionCache(SqliteLruCache):
+    """Transcripts stored in SQLite and keyed by audio hash and options."""
+
+    payload_columns = ("transcript TEXT NOT NULL",)
+
+    def __init__(self, db_path: str = "transcriptions.db", max_bytes: int = 0):
+        super().__init__(db_path, max_bytes)
+
+    @staticmethod
+    def make_key(
+        audio_hash: str,
+        model_name: str,
+        srt_mode: bool,
+        language: str,
+        streamed: bool = False,
+    ) -> str:
+        key = f"{audio_hash}:{model_name}:{int(srt_mode)}:{language}"
+        # Streamed transcripts are decoded in fixed windows and kept apart
+        return key + ":stream" if streamed else key
+
+    def put(self, key: str, transcript: str) -> None:
+        size = len(transcript.encode())
+        if self.connection is None or size > self.max_bytes:
+            return
+        self._insert(key, size, (transcript,))
+
+    def _load(self, payload: Sequence[Any]) -> str:
+        return payload[0]
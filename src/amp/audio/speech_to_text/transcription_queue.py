@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionJob:
+    def __init__(self, key: str, audio_content: Any):
+        self.key = key
+        self.audio_content = audio_content
+        self.future: Future = Future()
+
+
+class TranscriptionQueue:
+    """Collects concurrent transcription requests and runs them in batches.
+
+    A worker thread waits briefly after the first queued job so requests that
+    arrive together are transcribed together. Jobs with the same key that are
+    queued or running at the same time share one job and its result.
+    """
+
+    def __init__(
+        self,
+        transcribe_batch: Callable[[List[TranscriptionJob]], List[object]],
+        max_batch_size: int = 8,
+        batch_wait: float = 0.05,
+    ):
+        self.transcribe_batch = transcribe_batch
+        self.max_batch_size = max(max_batch_size, 1)
+        self.batch_wait = batch_wait
+        self.condition = threading.Condition()
+        self.pending: List[TranscriptionJob] = []
+        # Queued and running jobs by key
+        self.jobs: Dict[str, TranscriptionJob] = {}
+        self.worker = None
+
+    def submit(self, key: str, audio_content: Any) -> Future:
+        with self.condition:
+            if key in self.jobs:
+                return self.jobs[key].future
+
+            job = TranscriptionJob(key, audio_content)
+            self.jobs[key] = job
+            self.pending.append(job)
+
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+            self.condition.notify()
+            return job.future
+
+    def get_pending_count(self) -> int:
+        with self.condition:
+            return len(self.pending)
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+
+            # Give requests arriving at the same time a chance to join the batch
+            if self.batch_wait > 0:
+                time.sleep(self.batch_wait)
+
+            with self.condition:
+                batch = self.pending[: self.max_batch_size]
+                del self.pending[: self.max_batch_size]
+
+            logger.debug(f"Transcribing a batch of {len(batch)} requests")
+            try:
+                results = self.transcribe_batch(batch)
+                for job, result in zip(batch, results):
+                    job.future.set_result(result)
+            except Exception as e:
+                logger.exception("Transcription batch failed")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            finally:
+                with self.condition:
+                    for job in batch:
+                        del self.jobs[job.key]
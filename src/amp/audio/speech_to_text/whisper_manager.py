@@ -1,71 +1,271 @@
 import hashlib
+import io
 import os
+import threading
+from typing import BinaryIO, Iterator, List, Optional
 
-from faster_whisper import WhisperModel
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from amp.audio.speech_to_text.audio_stream import HashingReader, decode_audio_windows
+from amp.audio.speech_to_text.batch_clips import (
+    TranscriptSegment,
+    merge_clips,
+    split_segments,
+)
+from amp.audio.speech_to_text.transcription_cache import TranscriptionCache
+from amp.audio.speech_to_text.transcription_queue import (
+    TranscriptionJob,
+    TranscriptionQueue,
+)
+
+SAMPLING_RATE = 16000
+LANGUAGE = "en"
+CHUNK_SECONDS = 30
+
+
+# Approximate memory use per Whisper model size in MB
+WHISPER_MODEL_SIZES_MB = {
+    "tiny": 150,
+    "base": 300,
+    "small": 1000,
+    "medium": 2500,
+    "large": 4500,
+    "turbo": 3000,
+}
 
 
 class WhisperManager:
     def __init__(self):
         self.whisper_model = None
+        self.batched_model = None
+        self.load_lock = threading.Lock()
+        # Number of 30 second audio chunks decoded together on the GPU
+        self.batch_size = int(os.getenv("AUDIO.WHISPER_BATCH_SIZE", 8))
+        self.transcription_queue = TranscriptionQueue(
+            self._transcribe_batch,
+            max_batch_size=int(os.getenv("AUDIO.WHISPER_MAX_BATCH_REQUESTS", 8)),
+            batch_wait=float(os.getenv("AUDIO.WHISPER_BATCH_WAIT_MS", 50)) / 1000,
+        )
+        self.transcription_cache = TranscriptionCache(
+            db_path=os.getenv("AUDIO.TRANSCRIPTION_CACHE_PATH", "transcriptions.db"),
+            max_bytes=int(os.getenv("AUDIO.TRANSCRIPTION_CACHE_MB", 256)) * 1024 * 1024,
+        )
 
     def unload_model(self):
         if self.whisper_model is not None:
+            self.batched_model = None
             del self.whisper_model
             self.whisper_model = None
 
     def model_is_loaded(self) -> bool:
         return self.whisper_model is not None
 
-    def transcribe(self, audio_content, srt_mode: bool = False):
-        md5_hash = hashlib.md5(audio_content).hexdigest()
-        filename = f"{md5_hash}.wav"
-        filepath = os.path.join("output", filename)
-
-        os.makedirs("output", exist_ok=True)
+    def estimate_memory_mb(self) -> int:
+        model_name = os.getenv("AUDIO.WHISPER_MODEL", "base.en")
+        for size, memory_mb in WHISPER_MODEL_SIZES_MB.items():
+            if model_name.startswith(size) or f"-{size}" in model_name:
+                return memory_mb
+        return WHISPER_MODEL_SIZES_MB["large"]
 
-        # Save the file temporarily
-        with open(filepath, "wb") as audio_file:
-            audio_file.write(audio_content)
+    def load_model(self):
+        with self.load_lock:
+            if self.whisper_model is None:
+                model_name = os.getenv("AUDIO.WHISPER_MODEL", "base.en")
+                print(f"Loading whisper model {model_name}")
+                self.whisper_model = WhisperModel(
+                    model_name, device="cuda", compute_type="int8_float16"  # "float16"
+                )
+                self.batched_model = BatchedInferencePipeline(self.whisper_model)
 
-        # Initialize Whisper model if it hasn't been already
-        if self.whisper_model is None:
-            model_name = os.getenv("AUDIO.WHISPER_MODEL", "base.en")
-            print(f"Loading whisper model {model_name}")
-            self.whisper_model = WhisperModel(
-                model_name, device="cuda", compute_type="int8_float16"  # "float16"
+    def get_cached_transcript(
+        self, md5_hash: str, srt_mode: bool = False, streamed: bool = False
+    ) -> Optional[str]:
+        """Returns a cached transcript, one from transcribe_stream only if streamed."""
+        transcript = self.transcription_cache.get(
+            self._get_cache_key(md5_hash, srt_mode)
+        )
+        if transcript is None and streamed:
+            transcript = self.transcription_cache.get(
+                self._get_cache_key(md5_hash, srt_mode, streamed=True)
             )
+        return transcript
+
+    def transcribe(
+        self, audio_content, srt_mode: bool = False, md5_hash: Optional[str] = None
+    ):
+        """Transcribes an encoded audio file or already decoded 16 kHz samples.
+
+        md5_hash identifies the audio for caching and deduplication and
+        defaults to the hash of audio_content.
+        """
+        if md5_hash is None:
+            md5_hash = hashlib.md5(audio_content).hexdigest()
+
+        cache_key = self._get_cache_key(md5_hash, srt_mode)
+        transcript = self.transcription_cache.get(cache_key)
+        if transcript is not None:
+            return transcript
+
+        # Identical audio that is already queued or being transcribed is shared
+        segments = self.transcription_queue.submit(md5_hash, audio_content).result()
+
+        if srt_mode:
+            transcript = self.generate_srt(segments)
+        else:
+            transcript = " ".join([x.text for x in segments])
+
+        transcript = transcript.strip()
+        self.transcription_cache.put(cache_key, transcript)
+        return transcript
+
+    def _get_cache_key(
+        self, md5_hash: str, srt_mode: bool, streamed: bool = False
+    ) -> str:
+        model_name = os.getenv("AUDIO.WHISPER_MODEL", "base.en")
+        return TranscriptionCache.make_key(
+            md5_hash, model_name, srt_mode, LANGUAGE, streamed
+        )
+
+    def _transcribe_batch(
+        self, jobs: List[TranscriptionJob]
+    ) -> List[List[TranscriptSegment]]:
+        """Transcribes several uploads in one pass of the batched pipeline.
+
+        The uploads are decoded in memory and their speech regions are found
+        with VAD. All regions are then transcribed together as clips of the
+        concatenated audio and mapped back to the upload they came from.
+        """
+        self.load_model()
+
+        vad_options = VadOptions(
+            max_speech_duration_s=CHUNK_SECONDS, min_silence_duration_ms=160
+        )
+        audio_parts = []
+        # Chunks and job offsets are sample indices into the concatenated audio
+        chunks = []
+        job_offsets = []
+        offset = 0
+        for job in jobs:
+            if isinstance(job.audio_content, np.ndarray):
+                audio = job.audio_content
+            else:
+                audio = decode_audio(
+                    io.BytesIO(job.audio_content), sampling_rate=SAMPLING_RATE
+                )
+            # Chunks never cross into the next job
+            clips = get_speech_timestamps(audio, vad_options)
+            for chunk in merge_clips(clips, CHUNK_SECONDS * SAMPLING_RATE):
+                chunks.append(
+                    {"start": offset + chunk["start"], "end": offset + chunk["end"]}
+                )
+            job_offsets.append(offset)
+            audio_parts.append(audio)
+            offset += audio.shape[0]
+
+        if not chunks:
+            return [[] for _ in jobs]
+
+        # The batched pipeline takes clip_timestamps in seconds and converts
+        # them back to sample indices itself
+        clip_timestamps = [
+            {
+                "start": chunk["start"] / SAMPLING_RATE,
+                "end": chunk["end"] / SAMPLING_RATE,
+            }
+            for chunk in chunks
+        ]
 
         initial_whisper_prompt = "DEFAULT"
-        language = "en"
 
-        # Transcribe audio
-        segments, _info = self.whisper_model.transcribe(  # type: ignore
-            filepath,
+        segments, _info = self.batched_model.transcribe(  # type: ignore
+            np.concatenate(audio_parts),
             beam_size=5,
             initial_prompt=initial_whisper_prompt,
-            language=language,
-            vad_filter=True,
+            language=LANGUAGE,
+            clip_timestamps=clip_timestamps,
+            batch_size=self.batch_size,
+            # The pipeline defaults to one segment per chunk, keep the
+            # sentence-level segments that SRT cues are built from
+            without_timestamps=False,
             word_timestamps=True,  # Enable word timestamps for SRT
         )
 
-        if srt_mode:
-            transcript = self.generate_srt(segments)
-        else:
-            transcript = " ".join([x.text for x in segments])
+        return split_segments(segments, job_offsets, SAMPLING_RATE)
 
-        # Clean up the saved file
-        os.remove(filepath)
+    def transcribe_stream(
+        self,
+        audio_source: BinaryIO,
+        srt_mode: bool = False,
+        md5_hash: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Yields each segment, or SRT cue in srt_mode, as soon as it is decoded.
 
-        return transcript.strip()
+        The pieces include their separators, so joining them gives the same
+        transcript as transcribe. audio_source is read incrementally, so
+        transcription can start while a streamed upload is still arriving. The
+        complete transcript is cached apart from those of transcribe under
+        md5_hash, by default the hash of everything read.
+        """
+        self.load_model()
+        # Held for the whole stream, so an unload meanwhile cannot pull the
+        # model away between windows
+        whisper_model = self.whisper_model
+
+        # A known hash lets a seekable source be passed to the decoder directly
+        reader = HashingReader(audio_source) if md5_hash is None else audio_source
+        window_seconds = float(os.getenv("AUDIO.STREAM_WINDOW_SECONDS", 30))
+        initial_whisper_prompt = "DEFAULT"
+
+        pieces = []
+        for window_offset, window in decode_audio_windows(
+            reader, window_seconds, SAMPLING_RATE
+        ):
+            segments, _info = whisper_model.transcribe(  # type: ignore
+                window,
+                beam_size=5,
+                initial_prompt=initial_whisper_prompt,
+                language=LANGUAGE,
+                vad_filter=True,
+                word_timestamps=True,  # Enable word timestamps for SRT
+            )
+
+            for segment in segments:
+                if srt_mode:
+                    segment = TranscriptSegment(
+                        segment.start + window_offset,
+                        segment.end + window_offset,
+                        segment.text,
+                    )
+                    piece = self.format_srt_cue(len(pieces) + 1, segment)
+                    separator = "\n\n"
+                else:
+                    piece = segment.text
+                    separator = " "
+                if pieces:
+                    piece = separator + piece
+                pieces.append(piece)
+                yield piece
+
+        if md5_hash is None:
+            reader.read_remaining()
+            md5_hash = reader.hexdigest()
+        transcript = "".join(pieces).strip()
+        cache_key = self._get_cache_key(md5_hash, srt_mode, streamed=True)
+        self.transcription_cache.put(cache_key, transcript)
 
     def generate_srt(self, segments):
         srt_output = ""
         for i, segment in enumerate(segments, start=1):
-            start = self.format_timestamp(segment.start)
-            end = self.format_timestamp(segment.end)
-            srt_output += f"{i}\n{start} --> {end}\n{segment.text}\n\n"
+            srt_output += self.format_srt_cue(i, segment) + "\n\n"
         return srt_output.strip()
 
+    def format_srt_cue(self, index: int, segment) -> str:
+        start = self.format_timestamp(segment.start)
+        end = self.format_timestamp(segment.end)
+        return f"{index}\n{start} --> {end}\n{segment.text}"
+
     def format_timestamp(self, seconds):
         hours = int(seconds // 3600)
         minutes = int((seconds % 3600) // 60)
@@ -0,0 +1,100 @@
+import wave
+from io import BytesIO
+from typing import Any, Dict, Sequence
+
+from amp.cache.sqlite_lru_cache import FileLruCache
+
+# Container and codec used for each storage format
+STORAGE_CODECS = {"flac": ("flac", "flac"), "opus": ("ogg", "libopus")}
+
+
+class AudioCache(FileLruCache):
+    """Synthesized WAV audio stored on disk within a byte budget.
+
+    With storage_format "flac" or "opus" audio is compressed on disk and
+    transcoded back to WAV when read.
+    """
+
+    payload_columns = ("filename TEXT NOT NULL", "sample_rate INTEGER NOT NULL")
+
+    def __init__(
+        self,
+        directory: str = "output/tts",
+        max_bytes: int = 0,
+        storage_format: str = "wav",
+    ):
+        super().__init__(directory, max_bytes)
+        self.storage_format = storage_format
+
+    def put(self, key: str, wav_data: bytes) -> None:
+        if self.connection is None:
+            return
+
+        with wave.open(BytesIO(wav_data), "rb") as wav_file:
+            sample_rate = wav_file.getframerate()
+
+        if self.storage_format in STORAGE_CODECS:
+            data = self._encode(wav_data, sample_rate)
+            filename = f"{key}.{self.storage_format}"
+        else:
+            data = wav_data
+            filename = f"{key}.wav"
+
+        self._write_file(key, filename, data, sample_rate)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        statistics = super().get_statistics()
+        statistics["storage_format"] = self.storage_format
+        return statistics
+
+    def _decode(self, payload: Sequence[Any]) -> bytes:
+        data, sample_rate = payload
+        if self.storage_format in STORAGE_CODECS:
+            return self._transcode_to_wav(data, sample_rate)
+        return data
+
+    def _encode(self, wav_data: bytes, sample_rate: int) -> bytes:
+        import av
+
+        container_format, codec = STORAGE_CODECS[self.storage_format]
+        output = BytesIO()
+        with av.open(BytesIO(wav_data)) as input_container, av.open(
+            output, "w", format=container_format
+        ) as output_container:
+            stream = output_container.add_stream(codec, rate=sample_rate)
+            stream.layout = "mono"
+            resampler = av.audio.resampler.AudioResampler(
+                format="s16", layout="mono", rate=sample_rate
+            )
+            for frame in input_container.decode(audio=0):
+                for resampled in resampler.resample(frame):
+                    for packet in stream.encode(resampled):
+                        output_container.mux(packet)
+            for resampled in resampler.resample(None):
+                for packet in stream.encode(resampled):
+                    output_container.mux(packet)
+            for packet in stream.encode(None):
+                output_container.mux(packet)
+        return output.getvalue()
+
+    def _transcode_to_wav(self, data: bytes, sample_rate: int) -> bytes:
+        import av
+
+        resampler = av.audio.resampler.AudioResampler(
+            format="s16", layout="mono", rate=sample_rate
+        )
+        pcm = bytearray()
+        with av.open(BytesIO(data)) as container:
+            for frame in container.decode(audio=0):
+                for resampled in resampler.resample(frame):
+                    pcm += resampled.to_ndarray().tobytes()
+            for resampled in resampler.resample(None):
+                pcm += resampled.to_ndarray().tobytes()
+
+        output = BytesIO()
+        with wave.open(output, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(bytes(pcm))
+        return output.getvalue()
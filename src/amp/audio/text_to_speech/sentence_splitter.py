@@ -0,0 +1,41 @@
+import re
+import threading
+from typing import List
+
+# Splits after sentence-ending punctuation followed by whitespace
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class SentenceSplitter:
+    """Splits text into sentences with spaCy or a lightweight rule-based splitter.
+
+    The spaCy pipeline is loaded once, on first use, and reused by every
+    request. The "rules" mode needs no model at all.
+    """
+
+    def __init__(self, mode: str = "spacy", model_name: str = "en_core_web_sm"):
+        self.mode = mode
+        self.model_name = model_name
+        self.nlp = None
+        self.lock = threading.Lock()
+
+    def split(self, text: str) -> List[str]:
+        if self.mode == "rules":
+            return [sentence for sentence in SENTENCE_END.split(text) if sentence]
+
+        doc = self._get_nlp()(text)
+        return [sentence.text for sentence in doc.sents]
+
+    def _get_nlp(self):
+        with self.lock:
+            if self.nlp is None:
+                import spacy
+
+                try:
+                    self.nlp = spacy.load(self.model_name)
+                except OSError:
+                    from spacy.cli import download  # type: ignore
+
+                    download(self.model_name)
+                    self.nlp = spacy.load(self.model_name)
+            return self.nlp
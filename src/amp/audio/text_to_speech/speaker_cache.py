@@ -0,0 +1,28 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Tuple
+
+
+class SpeakerLatentCache:
+    """LRU cache of XTTS speaker conditioning keyed by the clone audio hash."""
+
+    def __init__(self, max_size: int = 32):
+        self.max_size = max_size
+        self.cache: "OrderedDict[str, Tuple[Any, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str, compute: Callable[[], Tuple[Any, Any]]) -> Tuple[Any, Any]:
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        latents = compute()
+
+        with self.lock:
+            self.cache[key] = latents
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+        return latents
+
@@ -0,0 +1,32 @@
+import struct
+
+# Size used for the RIFF and data chunks when the total length is not known yet
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def streaming_wav_header(channels: int, sample_width: int, sample_rate: int) -> bytes:
+    """Returns a WAV header for PCM data whose length is not known up front.
+
+    Players treat the maximum chunk size as "read until the end of the
+    stream", so audio can be sent while later sentences are synthesized.
+    """
+    byte_rate = sample_rate * channels * sample_width
+    block_align = channels * sample_width
+    return (
+        b"RIFF"
+        + struct.pack("<I", UNKNOWN_SIZE)
+        + b"WAVE"
+        + b"fmt "
+        + struct.pack(
+            "<IHHIIHH",
+            16,
+            1,  # PCM
+            channels,
+            sample_rate,
+            byte_rate,
+            block_align,
+            sample_width * 8,
+        )
+        + b"data"
+        + struct.pack("<I", UNKNOWN_SIZE)
+    )
@@ -1,9 +1,16 @@
-from typing import List, Optional
+from typing import Any, Iterator, List, Optional, Tuple
 import torch
 import hashlib
 import os
+import queue
+import tempfile
+import threading
+from io import BytesIO
 from TTS.api import TTS  # type: ignore
-import spacy
+
+from amp.audio.text_to_speech.audio_cache import AudioCache
+from amp.audio.text_to_speech.sentence_splitter import SentenceSplitter
+from amp.audio.text_to_speech.speaker_cache import SpeakerLatentCache
 
 
 class XttsManager:
@@ -11,79 +18,175 @@ class XttsManager:
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print("TTS IS USING", self.device)
         self.tts = None
+        self.load_lock = threading.Lock()
+        # Sentences synthesized ahead of the one currently being sent
+        self.lookahead = int(os.getenv("AUDIO.TTS_LOOKAHEAD", 1))
+        # "spacy" or "rules"
+        self.sentence_splitter = SentenceSplitter(
+            os.getenv("AUDIO.SENTENCE_SPLITTER", "spacy")
+        )
+        self.speaker_cache = SpeakerLatentCache(
+            int(os.getenv("AUDIO.SPEAKER_CACHE_SIZE", 32))
+        )
+        self.audio_cache = AudioCache(
+            directory=os.getenv("AUDIO.TTS_CACHE_DIRECTORY", "output/tts"),
+            max_bytes=int(os.getenv("AUDIO.TTS_CACHE_MB", 1024)) * 1024 * 1024,
+            # "wav", or "flac"/"opus" to compress cached audio
+            storage_format=os.getenv("AUDIO.TTS_CACHE_FORMAT", "wav"),
+        )
 
     def text_to_speech(
         self, text: str, clone_audio_data: Optional[bytes] = None
-    ) -> str:
-        output_folder = "output"
-        if not os.path.exists(output_folder):
-            os.mkdir(output_folder)
-
+    ) -> bytes:
+        """Returns the WAV data for text, synthesized or from the audio cache."""
         # Combine text and clone_audio_data for MD5 calculation
         hash_input = text.encode()
         if clone_audio_data:
             hash_input += clone_audio_data
         md5sum = hashlib.md5(hash_input).hexdigest()
-        output_path = os.path.join(output_folder, f"{md5sum}.wav")
 
-        if not os.path.exists(output_path):
-            if self.tts is None:
-                self.tts = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(
-                    self.device
-                )
+        wav_data = self.audio_cache.get(md5sum)
+        if wav_data is None:
+            self.load_model()
 
-            if clone_audio_data:
-                # Create a temporary file for the clone audio data
-                temp_audio_path = os.path.join(output_folder, "temp_clone_audio.wav")
-                with open(temp_audio_path, "wb") as temp_file:
-                    temp_file.write(clone_audio_data)
-                speaker_wav = temp_audio_path
-            else:
-                speaker_wav = os.getenv("AUDIO.VOICE_TO_CLONE", "example_audio.wav")
-
-            if os.path.exists(speaker_wav):
-                self.tts.tts_to_file(  # type: ignore
-                    text,
-                    speaker_wav=speaker_wav,
-                    file_path=output_path,
-                    language="en",
+            speaker_wav = os.getenv("AUDIO.VOICE_TO_CLONE", "example_audio.wav")
+            if not clone_audio_data and not os.path.exists(speaker_wav):
+                raise FileNotFoundError(
+                    f"Add a voice file to {speaker_wav} to clone that voice"
                 )
-            else:
-                print(f"Error: Add a voice file to {speaker_wav} to clone that voice")
 
-            # Remove the temporary file if it was created
-            if clone_audio_data and os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
-
-        return output_path
+            gpt_cond_latent, speaker_embedding = self.get_speaker_latents(
+                clone_audio_data
+            )
+            xtts_model = self.tts.synthesizer.tts_model  # type: ignore
+            # Same sampling settings as TTS.tts_to_file uses for XTTS
+            output = xtts_model.inference(
+                text,
+                "en",
+                gpt_cond_latent,
+                speaker_embedding,
+                temperature=xtts_model.config.temperature,
+                length_penalty=xtts_model.config.length_penalty,
+                repetition_penalty=xtts_model.config.repetition_penalty,
+                top_k=xtts_model.config.top_k,
+                top_p=xtts_model.config.top_p,
+                enable_text_splitting=True,
+            )
+            wav_buffer = BytesIO()
+            synthesizer = self.tts.synthesizer  # type: ignore
+            synthesizer.save_wav(wav=output["wav"], path=wav_buffer)
+            wav_data = wav_buffer.getvalue()
+            self.audio_cache.put(md5sum, wav_data)
+
+        return wav_data
+
+    def get_speaker_latents(self, clone_audio_data: Optional[bytes]) -> Tuple[Any, Any]:
+        """Returns the XTTS conditioning for a voice, computed once per voice.
+
+        The cache holds the latents on the CPU so it keeps no GPU memory alive
+        after the model is unloaded, and survives reloading the model.
+        """
+        if clone_audio_data:
+            key = hashlib.md5(clone_audio_data).hexdigest()
+        else:
+            speaker_wav = os.getenv("AUDIO.VOICE_TO_CLONE", "example_audio.wav")
+            key = f"{speaker_wav}:{os.path.getmtime(speaker_wav)}"
+
+        def compute():
+            if not clone_audio_data:
+                return self._compute_speaker_latents(speaker_wav)
+
+            # A file per request, so concurrent requests cannot overwrite it
+            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
+                temp_file.write(clone_audio_data)
+            try:
+                return self._compute_speaker_latents(temp_file.name)
+            finally:
+                os.remove(temp_file.name)
+
+        gpt_cond_latent, speaker_embedding = self.speaker_cache.get(key, compute)
+        return gpt_cond_latent.to(self.device), speaker_embedding.to(self.device)
+
+    def _compute_speaker_latents(self, speaker_wav: str) -> Tuple[Any, Any]:
+        xtts_model = self.tts.synthesizer.tts_model  # type: ignore
+        gpt_cond_latent, speaker_embedding = xtts_model.get_conditioning_latents(
+            audio_path=[speaker_wav],
+            gpt_cond_len=xtts_model.config.gpt_cond_len,
+            gpt_cond_chunk_len=xtts_model.config.gpt_cond_chunk_len,
+            max_ref_length=xtts_model.config.max_ref_len,
+            sound_norm_refs=xtts_model.config.sound_norm_refs,
+        )
+        return gpt_cond_latent.cpu(), speaker_embedding.cpu()
 
     def text_to_speech_with_split(
         self, text: str, clone_audio_data: Optional[bytes] = None
-    ):
-        try:
-            nlp = spacy.load("en_core_web_sm")
-        except:
-            from spacy.cli import download  # type: ignore
-
-            download("en_core_web_sm")
-            nlp = spacy.load("en_core_web_sm")
-
+    ) -> Iterator[bytes]:
+        sentences = self.split_sentences(text)
+        if self.lookahead <= 0:
+            return (
+                self.text_to_speech(sentence, clone_audio_data)
+                for sentence in sentences
+            )
+        return self._synthesize_ahead(sentences, clone_audio_data)
+
+    def split_sentences(self, text: str) -> List[str]:
         text = self.filter_text(text)
 
-        doc = nlp(text)
-
         sentences: List[str] = []
         current_sentence: str = ""
-        for sentence in doc.sents:
-            current_sentence += sentence.text
+        for sentence in self.sentence_splitter.split(text):
+            current_sentence += sentence
             if len(current_sentence) > 20:
                 sentences.append(current_sentence)
                 current_sentence = ""
         if current_sentence:
             sentences.append(current_sentence)
 
-        for sentence in sentences:
-            yield self.text_to_speech(sentence, clone_audio_data)
+        return sentences
+
+    def _synthesize_ahead(
+        self, sentences: List[str], clone_audio_data: Optional[bytes]
+    ) -> Iterator[bytes]:
+        """Yields the WAV data of each sentence while later ones are synthesized.
+
+        A worker thread runs up to lookahead sentences ahead of the consumer,
+        so sentence N+1 is synthesized while sentence N is being sent.
+        """
+        results: queue.Queue = queue.Queue(maxsize=self.lookahead)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def synthesize():
+            try:
+                for sentence in sentences:
+                    wav_data = self.text_to_speech(sentence, clone_audio_data)
+                    if not put((wav_data, None)):
+                        return
+                put((None, None))
+            except Exception as e:
+                put((None, e))
+
+        threading.Thread(target=synthesize, daemon=True).start()
+
+        try:
+            while True:
+                wav_data, error = results.get()
+                if error:
+                    raise error
+                if wav_data is None:
+                    return
+                yield wav_data
+        finally:
+            # Stops the worker after its current sentence if the client left
+            stop.set()
 
     def filter_text(self, text: str) -> str:
         response = "".join(
@@ -97,6 +200,21 @@ class XttsManager:
     def model_is_loaded(self):
         return self.tts is not None
 
+    def estimate_memory_mb(self) -> int:
+        if self.tts is None:
+            return 2500  # Approximate size of XTTS v2 once loaded
+        return sum(
+            parameter.numel() * parameter.element_size()
+            for parameter in self.tts.parameters()
+        ) // (1024 * 1024)
+
+    def load_model(self):
+        with self.load_lock:
+            if self.tts is None:
+                self.tts = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(
+                    self.device
+                )
+
     def unload_model(self):
         if self.tts is not None:
             del self.tts
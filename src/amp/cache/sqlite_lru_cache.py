@@ -0,0 +1,181 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteLruCache:
+    """Cache entries indexed in SQLite and kept within a byte budget.
+
+    The index records the size, last access and hit count of every entry, and
+    the least recently used entries are deleted once max_bytes is exceeded. A
+    max_bytes of 0 disables the cache. Subclasses decide how payloads are
+    stored, either in the extra payload_columns or elsewhere.
+    """
+
+    # Column definitions stored next to the index fields, e.g. "text TEXT"
+    payload_columns: Tuple[str, ...] = ()
+
+    def __init__(self, db_path: str, max_bytes: int = 0):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.payload_names = [column.split()[0] for column in self.payload_columns]
+
+        self.connection = None
+        if self.max_bytes > 0:
+            self.connection = sqlite3.connect(db_path, check_same_thread=False)
+            columns = "".join(f", {column}" for column in self.payload_columns)
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                    "last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0"
+                    f"{columns})"
+                )
+                self.connection.execute(
+                    "CREATE INDEX IF NOT EXISTS entries_last_access "
+                    "ON entries (last_access)"
+                )
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.connection is None:
+            return None
+
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {self._select_columns()} FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            payload = self._load(row[1:]) if row else None
+
+            if payload is None:
+                if row:
+                    # The payload was removed behind the index's back
+                    with self.connection:
+                        self.connection.execute(
+                            "DELETE FROM entries WHERE key = ?", (key,)
+                        )
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE entries SET last_access = ?, hits = hits + 1 "
+                    "WHERE key = ?",
+                    (time.time(), key),
+                )
+
+        return self._decode(payload)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            entries, total_bytes = 0, 0
+            if self.connection is not None:
+                entries, total_bytes = self.connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+                ).fetchone()
+
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.connection is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": entries,
+                "bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _insert(self, key: str, size: int, payload: Sequence[Any]) -> None:
+        """Indexes an entry of size bytes and evicts others if over budget."""
+        names = "".join(f", {name}" for name in self.payload_names)
+        placeholders = ", ?" * len(self.payload_names)
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO entries (key, size, last_access, hits"
+                    f"{names}) VALUES (?, ?, ?, 0{placeholders})",
+                    (key, size, time.time(), *payload),
+                )
+                self._evict()
+
+    def _evict(self) -> None:
+        (total_bytes,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+
+        rows = self.connection.execute(
+            f"SELECT {self._select_columns()}, size FROM entries ORDER BY last_access"
+        ).fetchall()
+        for row in rows:
+            if total_bytes <= self.max_bytes:
+                break
+
+            logger.debug(f"Evicting cache entry {row[0]}")
+            self._remove(row[1:-1])
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (row[0],))
+            total_bytes -= row[-1]
+
+    def _select_columns(self) -> str:
+        return ", ".join(["key"] + self.payload_names)
+
+    def _load(self, payload: Sequence[Any]) -> Optional[Any]:
+        """Returns the stored payload, or None if it is gone. Runs locked."""
+        return payload
+
+    def _decode(self, payload: Any) -> Any:
+        """Converts a loaded payload to the cached value. Runs unlocked."""
+        return payload
+
+    def _remove(self, payload: Sequence[Any]) -> None:
+        """Deletes payload data stored outside the index."""
+
+
+class FileLruCache(SqliteLruCache):
+    """SqliteLruCache whose payloads are files in one directory.
+
+    The first payload column holds the file name. Files are written to a
+    temporary name and renamed into place, so readers never see partial data.
+    """
+
+    payload_columns: Tuple[str, ...] = ("filename TEXT NOT NULL",)
+
+    def __init__(self, directory: str, max_bytes: int = 0):
+        self.directory = directory
+        if max_bytes > 0:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(os.path.join(directory, "index.db"), max_bytes)
+
+    def _write_file(self, key: str, filename: str, data: bytes, *payload) -> None:
+        if self.connection is None or len(data) > self.max_bytes:
+            return
+
+        # Write next to the destination and rename, which is atomic
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, os.path.join(self.directory, filename))
+
+        self._insert(key, len(data), (filename, *payload))
+
+    def _load(self, payload: Sequence[Any]) -> Optional[Any]:
+        # Read under the lock, so a concurrent put can't evict the file first
+        try:
+            with open(os.path.join(self.directory, payload[0]), "rb") as cache_file:
+                return (cache_file.read(), *payload[1:])
+        except FileNotFoundError:
+            return None
+
+    def _remove(self, payload: Sequence[Any]) -> None:
+        try:
+            os.remove(os.path.join(self.directory, payload[0]))
+        except FileNotFoundError:
+            pass
@@ -1,10 +1,35 @@
+import json
+import logging
 import os
+import queue
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import torch
 
 from diffusers import FlowMatchEulerDiscreteScheduler, AutoencoderKL
+from diffusers.models.transformers.transformer_flux import FluxTransformer2DModel
 from diffusers.pipelines.flux.pipeline_flux import FluxPipeline
-from transformers import CLIPTextModel, CLIPTokenizer, T5TokenizerFast
+from optimum.quanto import requantize
+from PIL import Image
+from safetensors.torch import load_file
+from transformers import (
+    CLIPTextModel,
+    CLIPTokenizer,
+    T5Config,
+    T5EncoderModel,
+    T5TokenizerFast,
+)
+
+from amp.image.image_generation.image_batch_queue import ImageBatchQueue, ImageRequest
+from amp.image.image_generation.image_cache import ImageCache
+from amp.image.image_generation.image_encoding import encode_image
+from amp.image.image_generation.prompt_embedding_cache import PromptEmbeddingCache
+
+logger = logging.getLogger(__name__)
 
 # Check if CUDA (GPU support) is available
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -13,18 +38,151 @@ dtype = torch.bfloat16
 bfl_repo = "black-forest-labs/FLUX.1-schnell"
 revision = "refs/pr/1"
 
+# Package written by flux_model_downloader.py
+package_path = os.path.join("models", "FLUX.1-schnell")
+manifest_path = os.path.join(package_path, "manifest.json")
+PACKAGE_FORMAT = 1
+
+# Pickled modules written by older versions of the downloader
 model_path = os.path.join("models", "FLUX.1-schnell.pth")
 text_encoder_path = os.path.join("models", "FLUX.1-schnell_text_encoder.pth")
 
+NUM_INFERENCE_STEPS = 4
+DEFAULT_GUIDANCE_SCALE = 3.5
+MAX_SEQUENCE_LENGTH = 512
+
 
 class FluxManager:
     def __init__(self):
         self.model_pipe = None
+        self.static_components = None
+        self.load_lock = threading.Lock()
+        self.batch_queue = ImageBatchQueue(
+            self._generate_batch,
+            max_batch_size=int(os.getenv("FLUX.MAX_BATCH_SIZE", 4)),
+            batch_wait=float(os.getenv("FLUX.BATCH_WAIT_MS", 50)) / 1000,
+        )
+        self.prompt_cache = PromptEmbeddingCache(
+            int(os.getenv("FLUX.PROMPT_CACHE_SIZE", 64))
+        )
+        self.image_cache = ImageCache(
+            directory=os.getenv("FLUX.IMAGE_CACHE_DIRECTORY", "output/images"),
+            max_bytes=int(os.getenv("FLUX.IMAGE_CACHE_MB", 1024)) * 1024 * 1024,
+        )
+
+    def estimate_memory_mb(self) -> int:
+        if self.model_pipe is None:
+            # Quantized transformer and T5 files plus about 1 GB for CLIP and the VAE
+            size = 1024 * 1024 * 1024
+            paths = [model_path, text_encoder_path]
+            if os.path.exists(manifest_path):
+                paths = [
+                    os.path.join(package_path, f"{name}.safetensors")
+                    for name in ["transformer", "text_encoder_2"]
+                ]
+            for path in paths:
+                if os.path.exists(path):
+                    size += os.path.getsize(path)
+            return size // (1024 * 1024)
+
+        size = 0
+        for component in [
+            self.model_pipe.transformer,
+            self.model_pipe.text_encoder,
+            self.model_pipe.text_encoder_2,
+            self.model_pipe.vae,
+        ]:
+            if component is not None:
+                size += sum(
+                    parameter.numel() * parameter.element_size()
+                    for parameter in component.parameters()
+                )
+        return size // (1024 * 1024)
 
     def load_model(self):
+        with self.load_lock:
+            return self._load_model()
+
+    def _load_model(self):
         if self.model_pipe is not None:
             return self.model_pipe
 
+        start_time = time.time()
+        if os.path.exists(manifest_path):
+            transformer, text_encoder_2, text_encoder, vae = self._load_package()
+        else:
+            transformer, text_encoder_2, text_encoder, vae = self._load_legacy()
+        scheduler, tokenizer, tokenizer_2 = self._get_static_components()
+
+        # Create pipeline
+        self.model_pipe = FluxPipeline(
+            scheduler=scheduler,
+            text_encoder=text_encoder,
+            tokenizer=tokenizer,
+            text_encoder_2=None,
+            tokenizer_2=tokenizer_2,
+            vae=vae,
+            transformer=None,
+        ).to(device)
+
+        self.model_pipe.text_encoder_2 = text_encoder_2
+        self.model_pipe.transformer = transformer
+        logger.info(f"Loaded FLUX in {time.time() - start_time:.1f} seconds")
+
+    def _load_package(self) -> Tuple[Any, Any, Any, Any]:
+        """Loads the weights of a package written by flux_model_downloader.py."""
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get("format") != PACKAGE_FORMAT:
+            raise ValueError(f"Unsupported FLUX package format in {manifest_path}.")
+        components = manifest["components"]
+
+        # The components are independent, so their files are read in parallel
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            transformer = executor.submit(
+                self._load_quantized,
+                FluxTransformer2DModel.from_config,
+                components["transformer"],
+            )
+            text_encoder_2 = executor.submit(
+                self._load_quantized,
+                lambda config: T5EncoderModel(T5Config.from_dict(config)),
+                components["text_encoder_2"],
+            )
+            text_encoder = executor.submit(
+                CLIPTextModel.from_pretrained,
+                os.path.join(package_path, "text_encoder"),
+                torch_dtype=dtype,
+            )
+            vae = executor.submit(
+                AutoencoderKL.from_pretrained,
+                os.path.join(package_path, "vae"),
+                torch_dtype=dtype,
+            )
+
+            text_encoder_2 = text_encoder_2.result()
+            # Tied embeddings are loaded as two copies, share them again
+            text_encoder_2.tie_weights()
+            return (
+                transformer.result(),
+                text_encoder_2,
+                text_encoder.result().to(device),
+                vae.result().to(device),
+            )
+
+    def _load_quantized(self, create_model, component: Dict[str, Any]) -> Any:
+        # Build the model without allocating memory, the weights replace it
+        with torch.device("meta"):
+            model = create_model(component["config"]).to(dtype)
+
+        # safetensors memory-maps the file instead of unpickling a copy of it
+        state_dict = load_file(os.path.join(package_path, component["weights"]))
+        requantize(model, state_dict, component["quantization_map"], device=device)
+        model.eval()
+        return model
+
+    def _load_legacy(self) -> Tuple[Any, Any, Any, Any]:
+        """Loads the pickled modules written by older versions of the downloader."""
         if not os.path.exists(model_path):
             raise FileNotFoundError(
                 f"Model file not found at {model_path}. Download file separately or run flux_model_downloader.py."
@@ -35,19 +193,9 @@ class FluxManager:
                 f"Text encoder file not found at {text_encoder_path}. Download file separately or run flux_model_downloader.py."
             )
 
-        # Load models and create pipeline
-        scheduler = FlowMatchEulerDiscreteScheduler.from_pretrained(
-            bfl_repo, subfolder="scheduler", revision=revision
-        )
         text_encoder = CLIPTextModel.from_pretrained(
             "openai/clip-vit-large-patch14", torch_dtype=dtype
         ).to(device)
-        tokenizer = CLIPTokenizer.from_pretrained(
-            "openai/clip-vit-large-patch14", torch_dtype=dtype
-        )
-        tokenizer_2 = T5TokenizerFast.from_pretrained(
-            bfl_repo, subfolder="tokenizer_2", torch_dtype=dtype, revision=revision
-        )
         vae = AutoencoderKL.from_pretrained(
             bfl_repo, subfolder="vae", torch_dtype=dtype, revision=revision
         ).to(device)
@@ -58,46 +206,258 @@ class FluxManager:
         text_encoder_2 = torch.load(text_encoder_path).to(device)
         text_encoder_2.eval()
 
-        # Create pipeline
-        self.model_pipe = FluxPipeline(
-            scheduler=scheduler,
-            text_encoder=text_encoder,
-            tokenizer=tokenizer,
-            text_encoder_2=None,
-            tokenizer_2=tokenizer_2,
-            vae=vae,
-            transformer=None,
-        ).to(device)
+        return transformer, text_encoder_2, text_encoder, vae
 
-        self.model_pipe.text_encoder_2 = text_encoder_2
-        self.model_pipe.transformer = transformer
+    def _get_static_components(self) -> Tuple[Any, Any, Any]:
+        # The scheduler and tokenizers hold no weights and are kept across unloads
+        if self.static_components is not None:
+            return self.static_components
+
+        if os.path.exists(manifest_path):
+            scheduler = FlowMatchEulerDiscreteScheduler.from_pretrained(
+                os.path.join(package_path, "scheduler")
+            )
+            tokenizer = CLIPTokenizer.from_pretrained(
+                os.path.join(package_path, "tokenizer")
+            )
+            tokenizer_2 = T5TokenizerFast.from_pretrained(
+                os.path.join(package_path, "tokenizer_2")
+            )
+        else:
+            scheduler = FlowMatchEulerDiscreteScheduler.from_pretrained(
+                bfl_repo, subfolder="scheduler", revision=revision
+            )
+            tokenizer = CLIPTokenizer.from_pretrained(
+                "openai/clip-vit-large-patch14", torch_dtype=dtype
+            )
+            tokenizer_2 = T5TokenizerFast.from_pretrained(
+                bfl_repo, subfolder="tokenizer_2", torch_dtype=dtype, revision=revision
+            )
+
+        self.static_components = (scheduler, tokenizer, tokenizer_2)
+        return self.static_components
 
     def generate_image(self, prompt, width, height, guidance_scale=None, seed=None):
+        image, _seed = self.generate_images(
+            [prompt], width, height, guidance_scale, [seed]
+        )[0]
+        return image
+
+    def generate_images(
+        self,
+        prompts: List[str],
+        width: int,
+        height: int,
+        guidance_scale: Optional[float] = None,
+        seeds: Optional[List[Optional[int]]] = None,
+        num_images_per_prompt: int = 1,
+    ) -> List[Tuple[Any, int]]:
+        """Generates num_images_per_prompt images for every prompt.
+
+        seeds holds one seed per image, None picks a random one. Returns each
+        image with the seed that reproduces it. Images with the same size and
+        guidance, including those of concurrent calls, share pipeline calls.
+        """
+        prompts, seeds = self._expand_requests(prompts, seeds, num_images_per_prompt)
+        if guidance_scale is None:
+            guidance_scale = DEFAULT_GUIDANCE_SCALE
+
+        settings = (width, height, guidance_scale)
+        futures = [
+            self.batch_queue.submit(
+                settings,
+                prompt,
+                seed if seed is not None else random.randint(0, 2**32 - 1),
+            )
+            for prompt, seed in zip(prompts, seeds)
+        ]
+        images = [future.result() for future in futures]
+
+        # Only seeded requests can be repeated, so only their images are cached
+        for prompt, seed, (image, _seed) in zip(prompts, seeds, images):
+            if seed is not None:
+                self._cache_image(prompt, width, height, guidance_scale, seed, image)
+        return images
+
+    def get_cached_images(
+        self,
+        prompts: List[str],
+        width: int,
+        height: int,
+        guidance_scale: Optional[float] = None,
+        seeds: Optional[List[Optional[int]]] = None,
+        num_images_per_prompt: int = 1,
+    ) -> Optional[List[Tuple[Any, int]]]:
+        """Returns the images of a request if every one of them is cached.
+
+        Takes the arguments of generate_images. Requests without a seed for
+        every image are never cached and return None.
+        """
+        prompts, seeds = self._expand_requests(prompts, seeds, num_images_per_prompt)
+        if guidance_scale is None:
+            guidance_scale = DEFAULT_GUIDANCE_SCALE
+        if any(seed is None for seed in seeds):
+            return None
+
+        images = []
+        for prompt, seed in zip(prompts, seeds):
+            png_data = self.image_cache.get(
+                self._get_cache_key(prompt, width, height, guidance_scale, seed)
+            )
+            if png_data is None:
+                return None
+            images.append((Image.open(BytesIO(png_data)), seed))
+        return images
+
+    def generate_image_stream(
+        self,
+        prompt: str,
+        width: int,
+        height: int,
+        guidance_scale: Optional[float] = None,
+        seed: Optional[int] = None,
+        preview_size: int = 256,
+    ) -> Iterator[Tuple[str, Any, int]]:
+        """Yields ("preview", image, step) after every denoising step.
+
+        Previews are decoded from the current latents and scaled down to at
+        most preview_size pixels. The final ("image", image, seed) follows.
+        """
+        if guidance_scale is None:
+            guidance_scale = DEFAULT_GUIDANCE_SCALE
+        seeded = seed is not None
+        if seed is None:
+            seed = random.randint(0, 2**32 - 1)
+
+        events: queue.Queue = queue.Queue()
+
+        def on_step(step: int, latents: Any) -> None:
+            preview = self._decode_preview(latents, width, height)
+            preview.thumbnail((preview_size, preview_size))
+            events.put(("preview", preview, step))
+
+        future = self.batch_queue.submit(
+            (width, height, guidance_scale), prompt, seed, on_step
+        )
+        future.add_done_callback(lambda _future: events.put(None))
+
+        for event in iter(events.get, None):
+            yield event
+
+        image, seed = future.result()
+        if seeded:
+            self._cache_image(prompt, width, height, guidance_scale, seed, image)
+        yield "image", image, seed
+
+    def _expand_requests(
+        self,
+        prompts: List[str],
+        seeds: Optional[List[Optional[int]]],
+        num_images_per_prompt: int,
+    ) -> Tuple[List[str], List[Optional[int]]]:
+        # One prompt and one seed per generated image
+        prompts = [prompt for prompt in prompts for _ in range(num_images_per_prompt)]
+        if seeds is None:
+            seeds = [None] * len(prompts)
+        if len(seeds) != len(prompts):
+            raise ValueError("Expected one seed per generated image.")
+        return prompts, seeds
+
+    def _get_cache_key(
+        self, prompt: str, width: int, height: int, guidance_scale: float, seed: int
+    ) -> str:
+        return ImageCache.make_key(
+            f"{bfl_repo}@{revision}",
+            prompt,
+            width,
+            height,
+            seed,
+            guidance_scale,
+            NUM_INFERENCE_STEPS,
+        )
+
+    def _cache_image(
+        self,
+        prompt: str,
+        width: int,
+        height: int,
+        guidance_scale: float,
+        seed: int,
+        image: Any,
+    ) -> None:
+        if self.image_cache.max_bytes <= 0:
+            return
+        png_data, _mimetype = encode_image(image)
+        self.image_cache.put(
+            self._get_cache_key(prompt, width, height, guidance_scale, seed), png_data
+        )
+
+    def _generate_batch(
+        self, settings: Tuple[Any, ...], requests: List[ImageRequest]
+    ) -> List[Tuple[Any, int]]:
         self.load_model()
 
         if self.model_pipe is None:
             raise RuntimeError("Image generation model not loaded.")
 
-        # Generate image
-        generator = torch.Generator(device=device)  # .manual_seed(123456)
-        if seed is not None:
-            generator.manual_seed(seed)
-        else:
-            generator.manual_seed(random.randint(0, 2**32 - 1))
+        width, height, guidance_scale = settings
 
-        if guidance_scale is None:
-            guidance_scale = 3.5
+        # One generator per image, so every image can be reproduced on its own
+        generators = [
+            torch.Generator(device=device).manual_seed(request.seed)
+            for request in requests
+        ]
 
-        image = self.model_pipe(
-            prompt=prompt,
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            latents = callback_kwargs["latents"]
+            for index, request in enumerate(requests):
+                if request.on_step:
+                    request.on_step(step + 1, latents[index : index + 1])
+            return callback_kwargs
+
+        # Variations of a prompt only differ in seed, so the text encoders
+        # run once per distinct prompt
+        embeddings = [
+            self.prompt_cache.get(
+                request.prompt, lambda: self._encode_prompt(request.prompt)
+            )
+            for request in requests
+        ]
+        prompt_embeds = torch.cat([embeds for embeds, _pooled in embeddings])
+        pooled_prompt_embeds = torch.cat([pooled for _embeds, pooled in embeddings])
+
+        has_listeners = any(request.on_step for request in requests)
+        images = self.model_pipe(
+            prompt_embeds=prompt_embeds.to(device),
+            pooled_prompt_embeds=pooled_prompt_embeds.to(device),
             width=width,
             height=height,
-            num_inference_steps=4,
-            generator=generator,
+            num_inference_steps=NUM_INFERENCE_STEPS,
+            generator=generators,
             guidance_scale=guidance_scale,
-        ).images[0]
+            callback_on_step_end=on_step_end if has_listeners else None,
+            callback_on_step_end_tensor_inputs=["latents"],
+            max_sequence_length=MAX_SEQUENCE_LENGTH,
+        ).images
 
-        return image
+        return [(image, request.seed) for image, request in zip(images, requests)]
+
+    def _encode_prompt(self, prompt: str) -> Tuple[Any, Any]:
+        prompt_embeds, pooled_prompt_embeds, _text_ids = self.model_pipe.encode_prompt(
+            prompt=prompt,
+            prompt_2=None,
+            device=device,
+            max_sequence_length=MAX_SEQUENCE_LENGTH,
+        )
+        return prompt_embeds, pooled_prompt_embeds
+
+    def _decode_preview(self, latents: Any, width: int, height: int) -> Any:
+        pipe = self.model_pipe
+        latents = pipe._unpack_latents(latents, height, width, pipe.vae_scale_factor)
+        config = pipe.vae.config
+        latents = latents / config.scaling_factor + config.shift_factor
+        image = pipe.vae.decode(latents, return_dict=False)[0]
+        return pipe.image_processor.postprocess(image, output_type="pil")[0]
 
     def model_is_loaded(self):
         return self.model_pipe is not None
@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ImageRequest:
+    def __init__(
+        self,
+        settings: Tuple[Any, ...],
+        prompt: str,
+        seed: int,
+        on_step: Optional[Callable[[int, Any], None]] = None,
+    ):
+        # Requests can only share a pipeline call if their settings are equal
+        self.settings = settings
+        self.prompt = prompt
+        self.seed = seed
+        # Called with the step number and the latents after each denoising step
+        self.on_step = on_step
+        self.future: Future = Future()
+
+
+class ImageBatchQueue:
+    """Merges concurrent image requests with the same settings into batches.
+
+    A worker thread waits briefly after the first queued request so requests
+    that arrive together, e.g. the n images of one request or simultaneous
+    requests of the same size, are generated in one pipeline call.
+    """
+
+    def __init__(
+        self,
+        generate_batch: Callable[[Tuple[Any, ...], List[ImageRequest]], List[Any]],
+        max_batch_size: int = 4,
+        batch_wait: float = 0.05,
+    ):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max(max_batch_size, 1)
+        self.batch_wait = batch_wait
+        self.condition = threading.Condition()
+        self.pending: List[ImageRequest] = []
+        self.worker = None
+
+    def submit(
+        self,
+        settings: Tuple[Any, ...],
+        prompt: str,
+        seed: int,
+        on_step: Optional[Callable[[int, Any], None]] = None,
+    ) -> Future:
+        with self.condition:
+            request = ImageRequest(settings, prompt, seed, on_step)
+            self.pending.append(request)
+
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+            self.condition.notify()
+            return request.future
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+
+            # Give requests arriving at the same time a chance to join the batch
+            if self.batch_wait > 0:
+                time.sleep(self.batch_wait)
+
+            with self.condition:
+                # Oldest request first, joined by later ones with equal settings
+                settings = self.pending[0].settings
+                batch = [r for r in self.pending if r.settings == settings]
+                batch = batch[: self.max_batch_size]
+                self.pending = [r for r in self.pending if r not in batch]
+
+            logger.debug(f"Generating a batch of {len(batch)} images")
+            try:
+                results = self.generate_batch(settings, batch)
+                for request, result in zip(batch, results):
+                    request.future.set_result(result)
+            except Exception as e:
+                logger.exception("Image batch failed")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
@@ -0,0 +1,43 @@
+import hashlib
+import json
+from typing import Any, Sequence
+
+from amp.cache.sqlite_lru_cache import FileLruCache
+
+
+class ImageCache(FileLruCache):
+    """PNG images of seeded requests stored on disk within a byte budget.
+
+    Images are content addressed by a hash of everything that determines the
+    output.
+    """
+
+    def __init__(self, directory: str = "output/images", max_bytes: int = 0):
+        super().__init__(directory, max_bytes)
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        prompt: str,
+        width: int,
+        height: int,
+        seed: int,
+        guidance_scale: float,
+        num_inference_steps: int,
+    ) -> str:
+        settings = [
+            model_name,
+            prompt,
+            int(width),
+            int(height),
+            int(seed),
+            float(guidance_scale),
+            int(num_inference_steps),
+        ]
+        return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()
+
+    def put(self, key: str, png_data: bytes) -> None:
+        self._write_file(key, f"{key}.png", png_data)
+
+    def _decode(self, payload: Sequence[Any]) -> bytes:
+        return payload[0]
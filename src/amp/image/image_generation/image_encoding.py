@@ -0,0 +1,33 @@
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# Pillow format name and MIME type for each supported output format
+IMAGE_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+
+
+def encode_image(
+    image: Image.Image, image_format: str = "png", quality: Optional[int] = None
+) -> Tuple[bytes, str]:
+    """Encodes image as PNG, WebP or JPEG and returns the data and MIME type.
+
+    quality (1-100) applies to WebP and JPEG and is ignored for PNG.
+    """
+    image_format = image_format.lower()
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format {image_format}.")
+
+    pillow_format, mimetype = IMAGE_FORMATS[image_format]
+    options = {}
+    if quality is not None and pillow_format != "PNG":
+        options["quality"] = int(quality)
+
+    buffered = BytesIO()
+    image.save(buffered, format=pillow_format, **options)
+    return buffered.getvalue(), mimetype
@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+
+class PromptEmbeddingCache:
+    """LRU cache of FLUX prompt embeddings keyed by the prompt text.
+
+    Entries are kept on the CPU, so they take no GPU memory and stay valid
+    while the pipeline is unloaded.
+    """
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self.cache: "OrderedDict[str, Tuple[Any, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, prompt: str, compute: Callable[[], Tuple[Any, Any]]
+    ) -> Tuple[Any, Any]:
+        """Returns (prompt_embeds, pooled_prompt_embeds), computing them if needed."""
+        with self.lock:
+            if prompt in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(prompt)
+                return self.cache[prompt]
+            self.misses += 1
+
+        prompt_embeds, pooled_prompt_embeds = compute()
+        embeddings = (prompt_embeds.cpu(), pooled_prompt_embeds.cpu())
+
+        with self.lock:
+            if self.max_size > 0:
+                self.cache[prompt] = embeddings
+                while len(self.cache) > self.max_size:
+                    self.cache.popitem(last=False)
+
+        return embeddings
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_size > 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self.cache),
+                "max_size": self.max_size,
+            }
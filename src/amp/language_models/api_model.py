@@ -1,4 +1,4 @@
-from typing import Sequence
+from typing import Iterator, Optional, Sequence
 from amp.language_models.model_message import ModelMessage
 from amp.language_models.model_response import ModelResponse
 from amp.language_models.prompt_formatter import PromptFormatter
@@ -12,11 +12,36 @@ class ApiModel:
     def get_model_path(self) -> str:
         return self.model_path
 
+    def get_context_window_size(self) -> int:
+        """Returns the context size available to a single request, 0 if unknown."""
+        return 0
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
     def generate_text(
         self,
         messages: Sequence[ModelMessage],
         max_tokens: int = 200,
         temperature: float = 0.2,
         response_prefix: str = "",
+        cache_key: Optional[str] = None,
+        prompt: Optional[str] = None,
     ) -> ModelResponse:
         return ModelResponse("TEXT", "MODEL_NAME")
+
+    def generate_text_stream(
+        self,
+        messages: Sequence[ModelMessage],
+        max_tokens: int = 200,
+        temperature: float = 0.2,
+        response_prefix: str = "",
+        cache_key: Optional[str] = None,
+        prompt: Optional[str] = None,
+    ) -> Iterator[str]:
+        yield self.generate_text(
+            messages, max_tokens, temperature, response_prefix, cache_key, prompt
+        ).get_text()
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,270 @@
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from amp.language_models.model_conversation import ModelConversation
+from amp.language_models.model_message import ModelMessage, Role
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """Conversations kept in a bounded in-memory LRU tier backed by SQLite.
+
+    Messages are appended to the database as they are added. Conversations
+    that are evicted from memory, or that existed before a restart, are
+    reloaded lazily on access. Conversations that are checked out are never
+    evicted, so a request always works on the only in-memory copy.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "conversations.db",
+        max_in_memory: int = 256,
+        ttl_seconds: int = 3600,
+        retention_days: int = 30,
+    ):
+        self.db_path = db_path
+        self.max_in_memory = max_in_memory
+        self.ttl_seconds = ttl_seconds
+        self.retention_days = retention_days
+        self.lock = threading.RLock()
+        # conversation_id -> (conversation, last access time), least recently used first
+        self.cache: "OrderedDict[str, Tuple[ModelConversation, float]]" = OrderedDict()
+        # conversation_id -> number of requests currently using it
+        self.checked_out: Dict[str, int] = {}
+
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._create_tables()
+        self._delete_expired_conversations()
+
+    def __contains__(self, conversation_id: str) -> bool:
+        with self.lock:
+            if conversation_id in self.cache:
+                return True
+            row = self.connection.execute(
+                "SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            return row is not None
+
+    def __getitem__(self, conversation_id: str) -> ModelConversation:
+        conversation = self.get(conversation_id)
+        if conversation is None:
+            raise KeyError(conversation_id)
+        return conversation
+
+    def __setitem__(self, conversation_id: str, conversation: ModelConversation):
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO conversations (id, model_path, last_access)"
+                    " VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE SET"
+                    " model_path = excluded.model_path,"
+                    " last_access = excluded.last_access",
+                    (conversation_id, conversation.get_model_path(), now),
+                )
+                self.connection.execute(
+                    "DELETE FROM messages WHERE conversation_id = ?",
+                    (conversation_id,),
+                )
+                self.connection.executemany(
+                    "INSERT INTO messages (conversation_id, role, content, timestamp)"
+                    " VALUES (?, ?, ?, ?)",
+                    [
+                        self._message_row(conversation_id, message)
+                        for message in conversation.messages
+                    ],
+                )
+            self._attach(conversation_id, conversation, now)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM conversations"
+            ).fetchone()[0]
+
+    def get(self, conversation_id: str) -> Optional[ModelConversation]:
+        now = time.time()
+        with self.lock:
+            self._evict_expired(now)
+
+            if conversation_id in self.cache:
+                conversation, _ = self.cache.pop(conversation_id)
+                self.cache[conversation_id] = (conversation, now)
+                return conversation
+
+            conversation = self._load(conversation_id)
+            if conversation is None:
+                return None
+
+            self.connection.execute(
+                "UPDATE conversations SET last_access = ? WHERE id = ?",
+                (now, conversation_id),
+            )
+            self.connection.commit()
+            self._attach(conversation_id, conversation, now)
+            return conversation
+
+    def get_or_create(
+        self, conversation_id: str, create: Callable[[], ModelConversation]
+    ) -> ModelConversation:
+        """Returns the conversation, creating it atomically if it does not exist."""
+        with self.lock:
+            conversation = self.get(conversation_id)
+            if conversation is not None:
+                return conversation
+
+            conversation = create()
+            now = time.time()
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO conversations (id, model_path, last_access)"
+                    " VALUES (?, ?, ?)",
+                    (conversation_id, conversation.get_model_path(), now),
+                )
+            self._attach(conversation_id, conversation, now)
+            return conversation
+
+    @contextmanager
+    def checkout(
+        self, conversation_id: str, create: Callable[[], ModelConversation]
+    ):
+        """Yields the conversation and keeps it in memory until the block exits."""
+        with self.lock:
+            conversation = self.get_or_create(conversation_id, create)
+            self.checked_out[conversation_id] = (
+                self.checked_out.get(conversation_id, 0) + 1
+            )
+        try:
+            yield conversation
+        finally:
+            with self.lock:
+                self.checked_out[conversation_id] -= 1
+                if not self.checked_out[conversation_id]:
+                    del self.checked_out[conversation_id]
+                if conversation_id in self.cache:
+                    # The idle time counts from the end of the request
+                    self.cache.pop(conversation_id)
+                    self.cache[conversation_id] = (conversation, time.time())
+
+    def keys(self) -> List[str]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id FROM conversations ORDER BY last_access DESC"
+            ).fetchall()
+            return [row[0] for row in rows]
+
+    def _attach(
+        self, conversation_id: str, conversation: ModelConversation, now: float
+    ) -> None:
+        conversation.message_listener = lambda message: self._append_message(
+            conversation_id, message
+        )
+        self.cache.pop(conversation_id, None)
+        self.cache[conversation_id] = (conversation, now)
+
+        excess = len(self.cache) - self.max_in_memory
+        if excess > 0:
+            evictable = [key for key in self.cache if key not in self.checked_out]
+            for key in evictable[:excess]:
+                del self.cache[key]
+
+    def _evict_expired(self, now: float) -> None:
+        for conversation_id, (_, last_access) in list(self.cache.items()):
+            if now - last_access < self.ttl_seconds:
+                break
+            if conversation_id not in self.checked_out:
+                del self.cache[conversation_id]
+
+    def _append_message(self, conversation_id: str, message: ModelMessage) -> None:
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO messages (conversation_id, role, content, timestamp)"
+                    " VALUES (?, ?, ?, ?)",
+                    self._message_row(conversation_id, message),
+                )
+                self.connection.execute(
+                    "UPDATE conversations SET last_access = ? WHERE id = ?",
+                    (time.time(), conversation_id),
+                )
+
+    def _load(self, conversation_id: str) -> Optional[ModelConversation]:
+        row = self.connection.execute(
+            "SELECT model_path FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        conversation = ModelConversation(row[0])
+        for role, content, timestamp in self.connection.execute(
+            "SELECT role, content, timestamp FROM messages"
+            " WHERE conversation_id = ? ORDER BY id",
+            (conversation_id,),
+        ):
+            conversation.messages.append(
+                ModelMessage(
+                    Role[role],
+                    content,
+                    datetime.datetime.fromtimestamp(timestamp),
+                )
+            )
+
+        logger.debug(f"Loaded conversation {conversation_id} from {self.db_path}")
+        return conversation
+
+    def _message_row(self, conversation_id: str, message: ModelMessage):
+        return (
+            conversation_id,
+            message.role.name,
+            message.content,
+            message.timestamp.timestamp(),
+        )
+
+    def _create_tables(self) -> None:
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY,
+                    model_path TEXT NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    timestamp REAL NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_conversation"
+                " ON messages (conversation_id)"
+            )
+
+    def _delete_expired_conversations(self) -> None:
+        if self.retention_days <= 0:
+            return
+
+        cutoff = time.time() - self.retention_days * 24 * 3600
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM messages WHERE conversation_id IN"
+                " (SELECT id FROM conversations WHERE last_access < ?)",
+                (cutoff,),
+            )
+            self.connection.execute(
+                "DELETE FROM conversations WHERE last_access < ?", (cutoff,)
+            )
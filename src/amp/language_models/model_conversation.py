@@ -1,8 +1,15 @@
 import datetime
-from typing import List
+import logging
+from typing import Callable, Dict, Iterator, List, Optional
 from amp.language_models.api_model import ApiModel
 
 from amp.language_models.model_message import ModelMessage, Role
+from amp.language_models.model_response import ModelResponse
+
+logger = logging.getLogger(__name__)
+
+# Tokens reserved for the assistant header and special tokens around the prompt
+PROMPT_OVERHEAD_TOKENS = 16
 
 
 class ModelConversation:
@@ -14,6 +21,9 @@ class ModelConversation:
         self.messages: List[ModelMessage] = []
         self.single_message_mode: bool = single_message_mode
         self.model_path: str = model_path
+        self.prompt_segments: Dict[str, List[str]] = {}
+        # Called with every added message, used by the conversation store to persist it
+        self.message_listener: Optional[Callable[[ModelMessage], None]] = None
 
     def get_model_path(self) -> str:
         return self.model_path
@@ -22,54 +32,164 @@ class ModelConversation:
         self.model_path = new_model_path
 
     def get_messages(self, single_message_mode: bool = False) -> List[ModelMessage]:
+        return [self.messages[i] for i in self._get_message_indices(single_message_mode)]
+
+    def get_prompt(
+        self, model: ApiModel, single_message_mode: bool = False, max_tokens: int = 0
+    ) -> str:
+        prompt_formatter = model.prompt_formatter
+
+        # Formatted segments are cached per formatter, so each turn only
+        # formats the messages added since the previous one
+        segments = self.prompt_segments.setdefault(prompt_formatter.model_type, [])
+        for message in self.messages[len(segments) :]:
+            segments.append(prompt_formatter.format_message(message))
+
+        indices = self._get_message_indices(single_message_mode)
+        indices = self._fit_to_context(model, indices, segments, max_tokens)
+        return prompt_formatter.generate_prompt(
+            [self.messages[i] for i in indices], [segments[i] for i in indices]
+        )
+
+    def _fit_to_context(
+        self,
+        model: ApiModel,
+        indices: List[int],
+        segments: List[str],
+        max_tokens: int,
+    ) -> List[int]:
+        """Drops the oldest non-system messages until the prompt fits the context."""
+        context_window_size = model.get_context_window_size()
+        if context_window_size <= 0:
+            return indices
+
+        budget = context_window_size - (max_tokens or 0) - PROMPT_OVERHEAD_TOKENS
+
+        # Byte-fallback tokenizers never need more tokens than the text has UTF-8
+        # bytes, so short prompts need no tokenizing
+        if sum(len(segments[i].encode()) for i in indices) <= budget:
+            return indices
+
+        system_indices = [i for i in indices if self.messages[i].is_system_message()]
+        kept: List[int] = list(system_indices)
+        kept_latest = False
+        used_tokens = sum(model.count_tokens(segments[i]) for i in system_indices)
+
+        for i in reversed(indices):
+            if i in system_indices:
+                continue
+
+            token_count = model.count_tokens(segments[i])
+            # The latest message is always kept, even if it alone exceeds the budget
+            if used_tokens + token_count > budget and kept_latest:
+                break
+
+            kept.append(i)
+            kept_latest = True
+            used_tokens += token_count
+
+        kept.sort()
+        if len(kept) < len(indices):
+            dropped = len(indices) - len(kept)
+            logger.info(f"Dropped {dropped} old messages to fit the context window")
+        return kept
+
+    def _get_message_indices(self, single_message_mode: bool) -> List[int]:
         if not self.messages:
             return []
 
         if single_message_mode:
-            messages: List[ModelMessage] = []
-            system_message = None
-            for message in self.messages:
+            indices: List[int] = []
+            system_index = None
+            for i, message in enumerate(self.messages):
                 if message.is_system_message():
-                    system_message = message
+                    system_index = i
 
-            if system_message:
-                messages.append(system_message)
+            if system_index is not None:
+                indices.append(system_index)
 
-            if len(self.messages) > 0 and not system_message == self.messages[-1]:
-                messages.append(self.messages[-1])
+            if system_index != len(self.messages) - 1:
+                indices.append(len(self.messages) - 1)
 
-            return messages
+            return indices
 
-        return self.messages[::]
+        return list(range(len(self.messages)))
 
     def add_user_message(self, content: str) -> None:
-        self.messages.append(ModelMessage(Role.USER, content, datetime.datetime.now()))
+        self.add_message(ModelMessage(Role.USER, content, datetime.datetime.now()))
 
     def add_assistant_message(self, content: str) -> None:
-        self.messages.append(
+        self.add_message(
             ModelMessage(Role.ASSISTANT, content, datetime.datetime.now())
         )
 
     def add_system_message(self, content: str) -> None:
-        self.messages.append(
+        self.add_message(
             ModelMessage(Role.SYSTEM, content, datetime.datetime.now())
         )
 
+    def add_message(self, message: ModelMessage) -> None:
+        self.messages.append(message)
+        if self.message_listener:
+            self.message_listener(message)
+
     def generate_message(
         self,
         model: ApiModel,
         max_tokens: int,
         single_message_mode: bool,
         response_prefix: str = "",
+        cache_key: Optional[str] = None,
     ) -> str:
+        return self.generate_response(
+            model,
+            max_tokens,
+            single_message_mode,
+            response_prefix=response_prefix,
+            cache_key=cache_key,
+        ).get_text()
+
+    def generate_response(
+        self,
+        model: ApiModel,
+        max_tokens: int,
+        single_message_mode: bool,
+        response_prefix: str = "",
+        cache_key: Optional[str] = None,
+    ) -> ModelResponse:
         messages = self.get_messages(single_message_mode)
 
         response = model.generate_text(
             messages,
             max_tokens,
             response_prefix=response_prefix,
+            cache_key=cache_key,
+            prompt=self.get_prompt(model, single_message_mode, max_tokens),
         )
 
         self.add_assistant_message(response.get_text())
 
-        return response.get_text()
+        return response
+
+    def generate_message_stream(
+        self,
+        model: ApiModel,
+        max_tokens: int,
+        single_message_mode: bool,
+        response_prefix: str = "",
+        cache_key: Optional[str] = None,
+    ) -> Iterator[str]:
+        messages = self.get_messages(single_message_mode)
+
+        chunks: List[str] = []
+        for chunk in model.generate_text_stream(
+            messages,
+            max_tokens,
+            response_prefix=response_prefix,
+            cache_key=cache_key,
+            prompt=self.get_prompt(model, single_message_mode, max_tokens),
+        ):
+            chunks.append(chunk)
+            yield chunk
+
+        self.add_assistant_message("".join(chunks).strip())
@@ -10,6 +10,8 @@ class Role(Enum):
 
 
 class ModelMessage:
+    __slots__ = ("role", "content", "timestamp", "actor_name")
+
     def __init__(
         self,
         role: Role,
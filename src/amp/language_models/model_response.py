@@ -1,10 +1,27 @@
+from typing import Optional
+
+
 class ModelResponse:
-    def __init__(self, text: str, model: str):
+    def __init__(
+        self,
+        text: str,
+        model: str,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+    ):
         self.text = text
         self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
 
     def get_text(self) -> str:
         return self.text
 
     def get_model(self) -> str:
         return self.model
+
+    def get_prompt_tokens(self) -> Optional[int]:
+        return self.prompt_tokens
+
+    def get_completion_tokens(self) -> Optional[int]:
+        return self.completion_tokens
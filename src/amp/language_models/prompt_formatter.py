@@ -1,4 +1,4 @@
-from typing import List, Sequence, Union
+from typing import Optional, Sequence
 
 from amp.language_models.model_message import ModelMessage
 
@@ -8,13 +8,20 @@ class PromptFormatter:
         self.model_type = model_type
 
     def generate_prompt(
-        self, messages: Sequence[ModelMessage]
-    ) -> str | List[Union[int, str]]:
-        prompt = ""
+        self,
+        messages: Sequence[ModelMessage],
+        segments: Optional[Sequence[str]] = None,
+    ) -> str:
+        """Renders messages into a prompt, reusing pre-formatted segments if given."""
+        if segments is None:
+            segments = [self.format_message(message) for message in messages]
 
-        for message in messages:
-            prompt += (
-                f"<|im_start|>{message.get_role()}\n{message.get_message()}<|im_end|>\n"
-            )
+        return self.join_segments(messages, segments)
 
-        return prompt.strip() + "<|im_start|>assistant"
+    def format_message(self, message: ModelMessage) -> str:
+        return f"<|im_start|>{message.get_role()}\n{message.get_message()}<|im_end|>\n"
+
+    def join_segments(
+        self, messages: Sequence[ModelMessage], segments: Sequence[str]
+    ) -> str:
+        return "".join(segments).strip() + "<|im_start|>assistant"
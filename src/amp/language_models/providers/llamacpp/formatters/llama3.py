@@ -1,4 +1,4 @@
-from typing import Sequence
+from typing import List, Sequence
 from amp.language_models.model_message import ModelMessage
 from amp.language_models.prompt_formatter import PromptFormatter
 
@@ -8,28 +8,24 @@ class Llama3Formatter(PromptFormatter):
     def __init__(self):
         super().__init__("LLAMA3")
 
-    # returns a list containing ints and strings
-    def generate_prompt(self, messages: Sequence[ModelMessage]) -> str:
-        prompt: str = ""  # Llama.cpp will inject the token below automatically
-        # prompt = "<|begin_of_text|>"
+    def format_message(self, message: ModelMessage) -> str:
+        return self._add_message(message.get_message(), message.get_role())
 
-        system_message = ""
+    def join_segments(
+        self, messages: Sequence[ModelMessage], segments: Sequence[str]
+    ) -> str:
+        # Llama.cpp will inject <|begin_of_text|> automatically
+        parts: List[str] = []
+        system_segment = ""
 
-        for message in messages:
+        for message, segment in zip(messages, segments):
             if message.is_system_message():
-                system_message = message.get_message()
+                system_segment = segment if message.get_message() else ""
+            elif message.is_user_message() or message.is_assistant_message():
+                parts.append(segment)
 
-        if system_message:
-            prompt += self._add_message(system_message, "system")
-
-        for message in messages:
-            if message.is_user_message():
-                prompt += self._add_message(message.get_message(), "user")
-            elif message.is_assistant_message():
-                prompt += self._add_message(message.get_message(), "assistant")
-
-        prompt += "<|start_header_id|>assistant<|end_header_id|>\n\n"
-        return prompt
+        parts.append("<|start_header_id|>assistant<|end_header_id|>\n\n")
+        return system_segment + "".join(parts)
 
     def _add_message(self, message: str, role: str) -> str:
         return f"<|start_header_id|>{role}<|end_header_id|>\n\n{message}<|eot_id|>"
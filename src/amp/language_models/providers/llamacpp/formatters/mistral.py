@@ -1,4 +1,4 @@
-from typing import List, Optional, Sequence, Union
+from typing import List, Optional, Sequence
 from amp.language_models.prompt_formatter import PromptFormatter
 from amp.language_models.model_message import ModelMessage
 
@@ -8,43 +8,45 @@ class MistralFormatter(PromptFormatter):
     def __init__(self):
         super().__init__("MISTRAL")
 
-        self.BOS = 1
-        self.EOS = 2
+        # llama-server adds the BOS token itself and parses special tokens in
+        # string prompts, so the EOS token can be written as text
+        self.EOS = "</s>"
 
-    # returns a list containing ints and strings
-    def generate_prompt(
-        self, messages: Sequence[ModelMessage]
-    ) -> List[Union[int, str]]:
-        prompt: List[Union[int, str]] = [self.BOS]
+    def format_message(self, message: ModelMessage) -> str:
+        if message.is_assistant_message():
+            return f"{message.get_message()}{self.EOS}"
+        return message.get_message()
+
+    def join_segments(
+        self, messages: Sequence[ModelMessage], segments: Sequence[str]
+    ) -> str:
+        parts: List[str] = []
 
         system_message = ""
         system_message_latest = ""
-        print(messages)
 
-        for i, message in enumerate(messages):
+        for i, (message, segment) in enumerate(zip(messages, segments)):
             if message.is_user_message():
                 if i == len(messages) - 1:
-                    prompt.append(self._user_message(message, system_message_latest))
+                    parts.append(self._user_message(segment, system_message_latest))
                 else:
-                    prompt.append(self._user_message(message, system_message))
+                    parts.append(self._user_message(segment, system_message))
                 system_message = ""
 
             elif message.is_assistant_message():
-                prompt.append(f"{message.get_message()}")
-                prompt.append(self.EOS)
+                parts.append(segment)
             elif message.is_system_message():
-                system_message = message.get_message()
+                system_message = segment
                 system_message_latest = system_message
 
         if system_message:
-            prompt.append(self._user_message(None, system_message))
+            parts.append(self._user_message(None, system_message))
 
-        print(prompt)
-        return prompt
+        return "".join(parts)
 
     def _user_message(
         self,
-        message: Optional[ModelMessage],
+        message: Optional[str],
         system_message: str,
     ) -> str:
 
@@ -55,7 +57,7 @@ class MistralFormatter(PromptFormatter):
             prompt_message += f"{system_message}\n\n"
 
         if message:
-            # prompt_message += f"<USER_MESSAGE>{message.get_message()}</USER_MESSAGE>"
-            prompt_message += f"{message.get_message()}"
+            # prompt_message += f"<USER_MESSAGE>{message}</USER_MESSAGE>"
+            prompt_message += f"{message}"
 
         return f"[INST] {prompt_message} [/INST]"
@@ -1,14 +1,18 @@
 import atexit
 import os
 import subprocess
-from typing import List
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
 import logging
 
 from amp.language_models.api_model import ApiModel
 from amp.language_models.prompt_formatter import PromptFormatter
+from amp.language_models.request_capture import RequestCapture
 from amp.language_models.providers.llamacpp.formatters.llama3 import Llama3Formatter
 from amp.language_models.providers.llamacpp.formatters.mistral import MistralFormatter
 from amp.language_models.providers.llamacpp.llamacpp_model import LlamaCppModel
+from amp.language_models.providers.llamacpp.model_load import ModelLoad
 
 
 logger = logging.getLogger(__name__)
@@ -18,122 +22,325 @@ class LlamaCppManager:
     def __init__(self, llama_cpp_path: str, start_port: int):
         self.llama_cpp_path = llama_cpp_path
         self.start_port = start_port
-        self.popen = None
+        # Memory is budgeted by the ResourceBroker, this only limits processes
+        self.max_loaded_models = int(os.getenv("LLAMACPP.MAX_LOADED_MODELS", 2))
+        # Number of sequences each llama-server decodes concurrently
+        self.parallel_slots = int(os.getenv("LLAMACPP.PARALLEL_SLOTS", 1))
+        self.http_pool_size = int(os.getenv("LLAMACPP.HTTP_POOL_SIZE", 10))
+        request_timeout = float(os.getenv("LLAMACPP.REQUEST_TIMEOUT", 0))
+        self.request_timeout = request_timeout if request_timeout > 0 else None
+        self.request_capture = RequestCapture()
+        # Directory where idle conversations' KV caches are saved, empty disables it
+        self.slot_save_path = os.getenv("LLAMACPP.SLOT_SAVE_PATH", "")
+        # Set by the request scheduler so busy models are drained before eviction
+        self.eviction_guard = None
+        load_timeout = float(os.getenv("LLAMACPP.LOAD_TIMEOUT", 300))
+        self.load_timeout = load_timeout if load_timeout > 0 else None
+        # Started and starting llama-server processes by model path
+        self.loads: Dict[str, ModelLoad] = {}
+        # Resident models, most recently used first
         self.active_models: List[ApiModel] = []
+        self.lock = threading.RLock()
         atexit.register(self.cleanup)
 
-    def model_is_loaded(self) -> bool:
-        return self.popen != None
+    def model_is_loaded(self, model_path: Optional[str] = None) -> bool:
+        if model_path is None:
+            return any(load.is_ready() for load in self.loads.values())
+        return model_path in self.loads and self.loads[model_path].is_ready()
 
     def load_model(
         self, model_index: int = -1, gpu_layers: int = -1, context_window_size: int = -1
     ) -> None:
-        try:
-            logger.debug("Starting model load process")
-            if model_index == -1:
-                last_model_used = os.getenv("MODEL.LAST_USED", "")
-                available_models = self.get_available_models()
-                try:
-                    model_index = available_models.index(last_model_used)
-                except ValueError:
-                    model_index = (
-                        0  # Default to the first model if last_model_used is not found
-                    )
-
-            if self.popen:
-                # Terminate the existing process
-                self.popen.terminate()
-                self.active_models.pop()
-
-            available_models = self.get_available_models()
-
-            model_identifier = available_models[model_index]
-
-            print("STARTING MODEL LOAD")
-            # Load a local model
-            model_path = os.path.join("models", model_identifier)
-            # print("PROMPT FORMAT:", self.read_prompt_format(model_path))
+        available_models = self.get_available_models()
 
-            print(self.llama_cpp_path)
-
-            if gpu_layers == -1:
-                gpu_layers = int(os.getenv("LLAMACPP.GPU_LAYERS", 9001))
-
-            if context_window_size == -1:
-                context_window_size = int(
-                    os.getenv("LLAMACPP.CONTEXT_WINDOW_SIZE", 8192)
+        if model_index == -1:
+            last_model_used = os.getenv("MODEL.LAST_USED", "")
+            try:
+                model_index = available_models.index(last_model_used)
+            except ValueError:
+                model_index = (
+                    0  # Default to the first model if last_model_used is not found
                 )
 
-            repeat_penalty = os.getenv("LLAMACPP.REPEAT_PENALTY", 1.1)
-
-            # Start a new child process with the llama cpp path and the model path as arguments
-            self.popen = subprocess.Popen(
-                [
-                    self.llama_cpp_path,
-                    "--n-gpu-layers",
-                    str(gpu_layers),
-                    "--ctx-size",
-                    str(context_window_size),
-                    "--port",
-                    str(self.start_port),
-                    "-m",
-                    model_path,
-                    "--repeat-penalty",
-                    str(repeat_penalty),
-                    "--predict",
-                    "-2",  # Only predict up to context window size
-                    "-fa",  # FLASH ATTENTION
-                    "--no-perf",  # No performance metrics
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-            )
-
-            while True:
-                if self.popen.stdout:
-                    try:
-                        line = self.popen.stdout.readline()
-                        print(line, end="")
+        self.request_model(
+            available_models[model_index], gpu_layers, context_window_size
+        ).result(timeout=self.load_timeout)
 
-                        if "all slots are idle" in line:
-                            break
+    def request_model(
+        self, model_identifier: str, gpu_layers: int = -1, context_window_size: int = -1
+    ) -> Future:
+        """Starts loading a model unless it is already loaded or loading.
 
-                    except Exception as e:
-                        print(e)
-                        break
-
-                else:
-                    return
+        Returns a future resolving to the model once llama-server is ready, shared
+        by every caller that requests the model while it loads.
+        """
+        try:
+            with self.lock:
+                if model_identifier in self.loads:
+                    load = self.loads[model_identifier]
+                    # The model is wanted again, so a pending unload is cancelled
+                    load.draining = False
+                    self._touch(model_identifier)
+                    return load.future
+
+                logger.debug("Starting model load process")
+                draining = self._make_room()
+                port = self._find_free_port()
+
+                # Load a local model
+                model_path = os.path.join("models", model_identifier)
+                # print("PROMPT FORMAT:", self.read_prompt_format(model_path))
+
+                if gpu_layers == -1:
+                    gpu_layers = int(os.getenv("LLAMACPP.GPU_LAYERS", 9001))
+
+                if context_window_size == -1:
+                    context_window_size = int(
+                        os.getenv("LLAMACPP.CONTEXT_WINDOW_SIZE", 8192)
+                    )
 
-            # Close the stdout pipe after the while loop to allow normal process output
-            if self.popen.stdout:
-                self.popen.stdout.close()
+                repeat_penalty = os.getenv("LLAMACPP.REPEAT_PENALTY", 1.1)
+
+                slot_arguments = []
+                if self.slot_save_path:
+                    os.makedirs(self.slot_save_path, exist_ok=True)
+                    slot_arguments = ["--slot-save-path", self.slot_save_path]
+
+                # The llama cpp path and the model path as arguments
+                command = (
+                    [
+                        self.llama_cpp_path,
+                        "--n-gpu-layers",
+                        str(gpu_layers),
+                        "--ctx-size",
+                        str(context_window_size),
+                        "--port",
+                        str(port),
+                        "-m",
+                        model_path,
+                        "--repeat-penalty",
+                        str(repeat_penalty),
+                        "--predict",
+                        "-2",  # Only predict up to context window size
+                        "-fa",  # FLASH ATTENTION
+                        "--no-perf",  # No performance metrics
+                        "--parallel",
+                        str(self.parallel_slots),
+                        "--cont-batching",
+                    ]
+                    + slot_arguments
+                )
 
-            prompt_formatter = self.get_prompt_formatter(model_identifier)
-            self.active_models.append(
-                LlamaCppModel(
+                prompt_formatter = self.get_prompt_formatter(model_identifier)
+                model = LlamaCppModel(
                     "127.0.0.1",
-                    str(self.start_port),
+                    str(port),
                     prompt_formatter,
                     model_identifier,
+                    pool_size=max(self.http_pool_size, self.parallel_slots),
+                    timeout=self.request_timeout,
+                    request_capture=self.request_capture,
+                    slot_count=self.parallel_slots,
+                    slot_persistence=bool(self.slot_save_path),
+                    # llama-server splits the context evenly between its slots
+                    context_window_size=context_window_size // self.parallel_slots,
                 )
-            )
-            logger.debug("Model loaded successfully")
+
+                load = ModelLoad(model_identifier, port, model)
+                self.loads[model_identifier] = load
+                self.active_models.insert(0, model)
+
+                if draining:
+                    # Evicted models finish their requests first, which must not
+                    # hold the lock, so the process is started once they are gone
+                    threading.Thread(
+                        target=self._start_after_eviction,
+                        args=(load, command, draining),
+                        daemon=True,
+                    ).start()
+                else:
+                    self._start_process(load, command)
+                return load.future
         except Exception as e:
             logger.exception("Exception during load_model")
             raise
 
-    def unload_model(self) -> None:
-        if self.popen:
-            logger.debug("Terminating llama.cpp subprocess")
-            self.popen.terminate()
-            self.popen = None
-        if self.active_models:
-            logger.debug("Clearing active models")
-            self.active_models.clear()
+    def _start_after_eviction(
+        self, load: ModelLoad, command: List[str], draining: List[str]
+    ) -> None:
+        while draining:
+            for model_path in draining:
+                if self.eviction_guard:
+                    self.eviction_guard.wait_until_idle(model_path)
+                with self.lock:
+                    # A victim requested again meanwhile is no longer draining
+                    victim = self.loads.get(model_path)
+                    if victim is not None and victim.draining:
+                        self._stop_load(model_path)
+
+            with self.lock:
+                # The load may have been unloaded itself while it waited
+                if self.loads.get(load.model_path) is not load:
+                    return
+
+                # A cancelled eviction may have left no room, so evict again
+                draining = self._make_room(exclude=load.model_path)
+                if not draining:
+                    self._start_process(load, command)
+
+    def _start_process(self, load: ModelLoad, command: List[str]) -> None:
+        # Start a new child process running llama-server
+        popen = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            universal_newlines=True,
+        )
+        load.start(popen, self.load_timeout or float("inf"), self._on_load_failure)
+        logger.info(f"Loading model {load.model_path} on port {load.port}")
+
+    def unload_model(self, model_path: Optional[str] = None) -> None:
+        """Unloads a model once its in-flight requests have finished.
+
+        The manager lock is not held while waiting, so other models can be
+        requested meanwhile. Requesting the model itself cancels the unload.
+        """
+        if model_path is None:
+            with self.lock:
+                model_paths = list(self.loads.keys())
+            for loaded_model_path in model_paths:
+                self.unload_model(loaded_model_path)
+            return
+
+        with self.lock:
+            load = self.loads.get(model_path)
+            if load is None:
+                return
+            load.draining = True
+
+        if self.eviction_guard:
+            self.eviction_guard.wait_until_idle(model_path)
+
+        with self.lock:
+            if self.loads.get(model_path) is load and load.draining:
+                self._stop_load(model_path)
+
+    def unload_if_idle(self, model_path: str) -> bool:
+        """Unloads a model at once unless it has in-flight requests.
+
+        Unlike unload_model this never waits, so it is safe to call while
+        holding other locks, such as the ResourceBroker's.
+        """
+        with self.lock:
+            if model_path not in self.loads:
+                return False
+            if self.eviction_guard and not self.eviction_guard.is_idle(model_path):
+                return False
+            self._stop_load(model_path)
+            return True
+
+    def _stop_load(self, model_path: str) -> None:
+        load = self.loads.pop(model_path)
+        logger.debug(f"Terminating llama.cpp subprocess for {model_path}")
+        load.stop()
+        self._remove_active_model(load.model)
+
+    def get_model(
+        self, model_path: str, gpu_layers: int = -1, context_window_size: int = -1
+    ) -> ApiModel:
+        available = model_path in self.loads or model_path in self.get_available_models()
+        if not available:
+            raise ValueError(f"Model {model_path} not found.")
+
+        return self.request_model(model_path, gpu_layers, context_window_size).result(
+            timeout=self.load_timeout
+        )
+
+    def preload_model(self, model_path: str) -> bool:
+        """Starts loading a model only if it fits without evicting another one."""
+        with self.lock:
+            if model_path in self.loads or len(self.loads) >= self.max_loaded_models:
+                return False
+
+            self.request_model(model_path)
+            return True
+
+    def get_load_status(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {
+                model_path: load.get_status() for model_path, load in self.loads.items()
+            }
+
+    def _on_load_failure(self, load: ModelLoad) -> None:
+        with self.lock:
+            # The model may already have been unloaded or replaced by a new load
+            if self.loads.get(load.model_path) is load:
+                del self.loads[load.model_path]
+            load.stop()
+            self._remove_active_model(load.model)
+
+    def _remove_active_model(self, model: ApiModel) -> None:
+        if model in self.active_models:
+            self.active_models.remove(model)
+            model.close()
+
+    def get_model_size_mb(self, model_path: str) -> int:
+        try:
+            return os.path.getsize(os.path.join("models", model_path)) // (1024 * 1024)
+        except OSError:
+            return 0
+
+    def _touch(self, model_path: str) -> None:
+        for i, model in enumerate(self.active_models):
+            if model.get_model_path() == model_path:
+                self.active_models.insert(0, self.active_models.pop(i))
+                return
+
+    def _make_room(self, exclude: Optional[str] = None) -> List[str]:
+        """Evicts models until another process fits, called with the lock held.
+
+        Idle models are stopped at once. Busy ones are marked as draining and
+        returned, and must be unloaded before their memory is used.
+        """
+        draining = []
+
+        def resident_models() -> List[str]:
+            return [
+                model.get_model_path()
+                for model in self.active_models
+                if model.get_model_path() != exclude
+                and not self.loads[model.get_model_path()].draining
+            ]
+
+        while resident_models():
+            resident = resident_models()
+            if len(resident) < self.max_loaded_models:
+                break
+
+            victim = resident[-1]
+            if self.eviction_guard:
+                # Prefer the least recently used model that has no in-flight work
+                for model_path in reversed(resident):
+                    if self.eviction_guard.is_idle(model_path):
+                        victim = model_path
+                        break
+
+            logger.info(f"Evicting llama.cpp model {victim}")
+            if self.eviction_guard is None or self.eviction_guard.is_idle(victim):
+                self._stop_load(victim)
+            else:
+                self.loads[victim].draining = True
+                draining.append(victim)
+        return draining
+
+    def _find_free_port(self) -> int:
+        port = self.start_port
+        used_ports = set(load.port for load in self.loads.values())
+        while port in used_ports:
+            port += 1
+        return port
 
     def read_prompt_format(self, model_path: str) -> str:
         from gguf import GGUFReader
@@ -160,27 +367,21 @@ class LlamaCppManager:
     def change_model(
         self, model_path: str, gpu_layers: int = -1, context_window_size: int = -1
     ) -> None:
-        for model in self.active_models:
-            if model.get_model_path() == model_path:
-                return
-
-        model_index = self.get_available_models().index(model_path)
-
-        if model_index == -1:
+        try:
+            self.get_model(model_path, gpu_layers, context_window_size)
+        except ValueError:
             print(f"Error: Model {model_path} not found.")
-            return
-
-        self.load_model(model_index, gpu_layers, context_window_size)
 
     def get_available_models(self) -> List[str]:
         models = list(filter(lambda f: f.endswith(".gguf"), os.listdir("models")))
         return models
 
     def __del__(self) -> None:
-        # Terminate the process if it is still running
-        if self.popen:
-            self.popen.kill()
-            self.popen = None
+        # Terminate the processes if they are still running
+        for load in self.loads.values():
+            if load.popen:
+                load.popen.kill()
+        self.loads.clear()
 
     def cleanup(self):
         logger.info("Cleaning up LlamaCppManager")
@@ -1,11 +1,17 @@
 import logging
-from typing import Sequence
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 from amp.language_models.api_model import ApiModel
 from amp.language_models.model_message import ModelMessage
 from amp.language_models.model_response import ModelResponse
 from amp.language_models.prompt_formatter import PromptFormatter
+from amp.language_models.request_capture import RequestCapture
+from amp.language_models.token_counter import TokenCounter
+from amp.language_models.providers.llamacpp.slot_manager import SlotManager
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +23,37 @@ class LlamaCppModel(ApiModel):
         host_port: str,
         prompt_formatter: PromptFormatter,
         model_path: str,
+        pool_size: int = 10,
+        timeout: Optional[float] = None,
+        retries: int = 3,
+        request_capture: Optional[RequestCapture] = None,
+        slot_count: int = 1,
+        slot_persistence: bool = False,
+        context_window_size: int = 0,
     ):
         super().__init__(model_path, prompt_formatter)
 
         self.host_url = host_url
         self.host_port = host_port
+        self.timeout = timeout
+        self.request_capture = request_capture
+        self.slot_manager = SlotManager(slot_count)
+        # Requires llama-server to be started with --slot-save-path
+        self.slot_persistence = slot_persistence
+        self.context_window_size = context_window_size
+        self.token_counter = TokenCounter(self._tokenize)
+
+        # Keep-alive connections to the local llama-server, only connection errors
+        # are retried so a completion is never submitted twice
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries, connect=retries, read=0, backoff_factor=0.1
+            ),
+        )
+        self.session.mount("http://", adapter)
 
     def generate_text(
         self,
@@ -29,40 +61,196 @@ class LlamaCppModel(ApiModel):
         max_tokens: int = 200,
         temperature: float = 0.2,
         response_prefix: str = "",
+        cache_key: Optional[str] = None,
+        prompt: Optional[str] = None,
     ) -> ModelResponse:
-        prompt = self.prompt_formatter.generate_prompt(messages)
+        if prompt is None:
+            prompt = self.prompt_formatter.generate_prompt(messages)
 
         if response_prefix:
             prompt += response_prefix
 
-        request = {
-            "prompt": prompt,
-            "n_predict": max_tokens,
-            "temperature": temperature,
-            "top_p": 0.8,
-            "min_p": 0.05,
-            "typical_p": 1,
-            "repeat_penalty": 1.18,
-            "top_k": 40,
-        }
-
-        with open("_input.txt", "w", encoding="utf8") as file:
-            file.write(str(prompt))
+        request = self._build_request(prompt, max_tokens, temperature)
 
         url = f"http://{self.host_url}:{self.host_port}/completion"
 
-        logger.info("LLAMA-CPP: GENERATING RESPONSE")
-        response = requests.post(url, json=request)
-        logger.info("LLAMA-CPP: RESPONSE GENERATED")
-
-        with open("_output.json", "w") as file:
-            json.dump(response.json(), file)
+        slot_id = self._acquire_slot(cache_key)
+        request["id_slot"] = slot_id
+        try:
+            logger.info("LLAMA-CPP: GENERATING RESPONSE")
+            response = self.session.post(url, json=request, timeout=self.timeout)
+            logger.info("LLAMA-CPP: RESPONSE GENERATED")
+        finally:
+            self._release_slot(slot_id)
 
         if response.status_code == 200:
             json_data = response.json()
+
+            if self.request_capture and self.request_capture.should_capture():
+                self.request_capture.capture(prompt, json_data)
+
             content = json_data["content"].strip()
             if "<|eot_id|>" in content:  # Temporary fix for LLama-3
                 content = content.split("<|eot_id|>")[0]
-            return ModelResponse(content, json_data["model"])
+            return ModelResponse(
+                content,
+                json_data["model"],
+                prompt_tokens=json_data.get("tokens_evaluated"),
+                completion_tokens=json_data.get("tokens_predicted"),
+            )
 
         return ModelResponse("", "")
+
+    def generate_text_stream(
+        self,
+        messages: Sequence[ModelMessage],
+        max_tokens: int = 200,
+        temperature: float = 0.2,
+        response_prefix: str = "",
+        cache_key: Optional[str] = None,
+        prompt: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Yields content chunks as they arrive from llama-server's SSE stream."""
+        if prompt is None:
+            prompt = self.prompt_formatter.generate_prompt(messages)
+
+        if response_prefix:
+            prompt += response_prefix
+
+        request = self._build_request(prompt, max_tokens, temperature)
+        request["stream"] = True
+
+        url = f"http://{self.host_url}:{self.host_port}/completion"
+
+        capture = self.request_capture and self.request_capture.should_capture()
+        chunks = []
+
+        slot_id = self._acquire_slot(cache_key)
+        request["id_slot"] = slot_id
+
+        logger.info("LLAMA-CPP: STREAMING RESPONSE")
+        with self._release_slot_after(slot_id), self.session.post(
+            url, json=request, stream=True, timeout=self.timeout
+        ) as response:
+            if response.status_code != 200:
+                logger.error(
+                    f"LLAMA-CPP: streaming failed, status_code={response.status_code}"
+                )
+                return
+
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+
+                json_data = json.loads(line[len("data: ") :])
+                content = json_data.get("content", "")
+                if capture:
+                    chunks.append(json_data)
+
+                if "<|eot_id|>" in content:  # Temporary fix for LLama-3
+                    content = content.split("<|eot_id|>")[0]
+                    if content:
+                        yield content
+                    break
+
+                if content:
+                    yield content
+
+                if json_data.get("stop"):
+                    break
+        logger.info("LLAMA-CPP: STREAMING DONE")
+
+        if capture:
+            self.request_capture.capture(prompt, chunks)
+
+    def get_context_window_size(self) -> int:
+        return self.context_window_size
+
+    def count_tokens(self, text: str) -> int:
+        token_count = self.token_counter.count(text)
+        if token_count is None:
+            # Rough estimate if llama-server could not tokenize the text
+            return len(text) // 2 + 1
+        return token_count
+
+    def _tokenize(self, text: str) -> Optional[int]:
+        url = f"http://{self.host_url}:{self.host_port}/tokenize"
+        try:
+            response = self.session.post(
+                url, json={"content": text}, timeout=self.timeout
+            )
+            if response.status_code == 200:
+                return len(response.json()["tokens"])
+        except requests.RequestException:
+            logger.exception("LLAMA-CPP: tokenize failed")
+        return None
+
+    def _acquire_slot(self, cache_key: Optional[str]) -> int:
+        if not cache_key:
+            return -1
+
+        slot_id, previous_key = self.slot_manager.acquire(cache_key)
+        if slot_id == -1 or previous_key == cache_key or not self.slot_persistence:
+            return slot_id
+
+        # Keep the KV cache of the conversation losing the slot, and bring back
+        # the cache of the conversation taking it over
+        if previous_key is not None and self._slot_action(
+            slot_id, "save", previous_key
+        ):
+            self.slot_manager.mark_saved(previous_key)
+
+        if self.slot_manager.pop_saved(cache_key):
+            self._slot_action(slot_id, "restore", cache_key)
+
+        return slot_id
+
+    def _release_slot(self, slot_id: int) -> None:
+        if slot_id != -1:
+            self.slot_manager.release(slot_id)
+
+    @contextmanager
+    def _release_slot_after(self, slot_id: int):
+        try:
+            yield
+        finally:
+            self._release_slot(slot_id)
+
+    def _slot_action(self, slot_id: int, action: str, cache_key: str) -> bool:
+        url = f"http://{self.host_url}:{self.host_port}/slots/{slot_id}"
+        try:
+            response = self.session.post(
+                url,
+                params={"action": action},
+                json={"filename": self.slot_manager.get_filename(cache_key)},
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            logger.exception(f"LLAMA-CPP: slot {action} failed")
+            return False
+
+        if response.status_code != 200:
+            logger.warning(
+                f"LLAMA-CPP: slot {action} failed, status_code={response.status_code}"
+            )
+            return False
+
+        return True
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _build_request(
+        self, prompt: str, max_tokens: int, temperature: float
+    ) -> Dict[str, Any]:
+        return {
+            "prompt": prompt,
+            "n_predict": max_tokens,
+            "temperature": temperature,
+            "top_p": 0.8,
+            "min_p": 0.05,
+            "typical_p": 1,
+            "repeat_penalty": 1.18,
+            "top_k": 40,
+            "cache_prompt": True,
+        }
@@ -0,0 +1,130 @@
+import logging
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+
+import requests
+
+from amp.language_models.api_model import ApiModel
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoad:
+    """Tracks a llama-server process from startup until it serves requests.
+
+    Readiness is detected by polling /health on a background thread, while
+    another thread drains the process output into a bounded log buffer so the
+    pipe never fills up. Callers wait on the shared future. A load waiting for
+    other models to be evicted has no process until start is called.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        port: int,
+        model: ApiModel,
+        max_log_lines: int = 200,
+    ):
+        self.model_path = model_path
+        self.popen: Optional[subprocess.Popen] = None
+        self.port = port
+        self.model = model
+        self.state = "waiting"
+        # Set while the model is being unloaded once its requests finish
+        self.draining = False
+        self.future: Future = Future()
+        self.logs: Deque[str] = deque(maxlen=max_log_lines)
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def start(
+        self,
+        popen: subprocess.Popen,
+        load_timeout: float,
+        on_failure: Callable[["ModelLoad"], None],
+    ) -> None:
+        self.popen = popen
+        self.state = "loading"
+        self.started_at = time.time()
+        threading.Thread(target=self._drain_logs, daemon=True).start()
+        threading.Thread(
+            target=self._wait_until_ready, args=(load_timeout, on_failure), daemon=True
+        ).start()
+
+    def stop(self) -> None:
+        if self.popen:
+            self.popen.terminate()
+        self._finish(error=RuntimeError(f"Model {self.model_path} was unloaded."))
+
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def get_status(self) -> Dict[str, Any]:
+        end = self.ready_at if self.ready_at else time.time()
+        return {
+            "state": "draining" if self.draining else self.state,
+            "port": self.port,
+            "seconds": round(end - self.started_at, 1),
+            "logs": list(self.logs)[-10:],
+        }
+
+    def _drain_logs(self) -> None:
+        if not self.popen.stdout:
+            return
+
+        for line in self.popen.stdout:
+            line = line.rstrip()
+            self.logs.append(line)
+            logger.debug(f"[{self.model_path}] {line}")
+
+    def _wait_until_ready(
+        self, load_timeout: float, on_failure: Callable[["ModelLoad"], None]
+    ) -> None:
+        url = f"http://127.0.0.1:{self.port}/health"
+
+        while not self.future.done():
+            if self.popen.poll() is not None:
+                error = f"llama-server exited with code {self.popen.returncode}"
+                break
+
+            if time.time() - self.started_at > load_timeout:
+                error = f"llama-server did not become ready in {load_timeout}s"
+                break
+
+            try:
+                if requests.get(url, timeout=1).status_code == 200:
+                    self._finish()
+                    return
+            except requests.RequestException:
+                pass
+
+            time.sleep(0.25)
+        else:
+            return
+
+        logger.error(f"Loading {self.model_path} failed: {error}")
+        # Fail waiting requests first so they release their pins before cleanup
+        self._finish(error=RuntimeError(f"Loading {self.model_path} failed: {error}"))
+        on_failure(self)
+
+    def _finish(self, error: Optional[Exception] = None) -> None:
+        with self.lock:
+            if self.future.done():
+                return
+
+            if error:
+                self.state = "failed"
+                self.future.set_exception(error)
+            else:
+                self.state = "ready"
+                self.ready_at = time.time()
+                logger.info(
+                    f"Model {self.model_path} ready on port {self.port} after "
+                    f"{self.ready_at - self.started_at:.1f}s"
+                )
+                self.future.set_result(self.model)
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class SlotManager:
+    """Pins conversations to llama-server slots so their KV cache can be reused.
+
+    Each cache key keeps the slot it last used while that slot is free. When a
+    slot is handed to another key, the previous owner is reported so its KV
+    cache can be saved to disk and restored when it returns.
+    """
+
+    def __init__(self, slot_count: int):
+        self.slot_count = slot_count
+        self.lock = threading.Lock()
+        self.owners: Dict[int, Optional[str]] = {i: None for i in range(slot_count)}
+        self.busy: Set[int] = set()
+        # Slots ordered from least to most recently used
+        self.usage_order: List[int] = list(range(slot_count))
+        self.saved_keys: Set[str] = set()
+
+    def acquire(self, cache_key: str) -> Tuple[int, Optional[str]]:
+        """Returns the slot for cache_key and the key that owned it before.
+
+        Returns a slot id of -1 when every slot is busy, which lets llama-server
+        pick one itself.
+        """
+        with self.lock:
+            slot_id = self._find_owned_slot(cache_key)
+
+            if slot_id is None:
+                idle_slots = [i for i in self.usage_order if i not in self.busy]
+                if not idle_slots:
+                    return -1, None
+                slot_id = idle_slots[0]
+                # A key owns at most one slot, so the KV cache left in a busy
+                # slot it owned is never saved over the state of the new one
+                for owned_slot, owner in self.owners.items():
+                    if owner == cache_key:
+                        self.owners[owned_slot] = None
+
+            previous_key = self.owners[slot_id]
+            self.owners[slot_id] = cache_key
+            self.busy.add(slot_id)
+            self.usage_order.remove(slot_id)
+            self.usage_order.append(slot_id)
+
+            return slot_id, previous_key
+
+    def release(self, slot_id: int) -> None:
+        with self.lock:
+            self.busy.discard(slot_id)
+
+    def mark_saved(self, cache_key: str) -> None:
+        with self.lock:
+            self.saved_keys.add(cache_key)
+
+    def pop_saved(self, cache_key: str) -> bool:
+        with self.lock:
+            if cache_key in self.saved_keys:
+                self.saved_keys.remove(cache_key)
+                return True
+            return False
+
+    def get_filename(self, cache_key: str) -> str:
+        return hashlib.md5(cache_key.encode()).hexdigest() + ".bin"
+
+    def _find_owned_slot(self, cache_key: str) -> Optional[int]:
+        for slot_id, owner in self.owners.items():
+            if owner == cache_key and slot_id not in self.busy:
+                return slot_id
+        return None
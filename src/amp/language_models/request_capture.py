@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCapture:
+    """Writes sampled prompts and responses to disk for debugging.
+
+    Disabled by default. Captures are handed to a background writer thread, and
+    only the newest max_captures request directories are kept.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        sample_rate: Optional[float] = None,
+        capture_dir: Optional[str] = None,
+        max_captures: Optional[int] = None,
+    ):
+        if enabled is None:
+            enabled = os.getenv("CAPTURE.ENABLED", "false").lower() == "true"
+        if sample_rate is None:
+            sample_rate = float(os.getenv("CAPTURE.SAMPLE_RATE", 1.0))
+        if capture_dir is None:
+            capture_dir = os.getenv("CAPTURE.DIRECTORY", "captures")
+        if max_captures is None:
+            max_captures = int(os.getenv("CAPTURE.MAX_CAPTURES", 100))
+
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.capture_dir = capture_dir
+        self.max_captures = max_captures
+        self.queue: queue.Queue = queue.Queue(maxsize=256)
+        self.writer_thread = None
+
+        if self.enabled:
+            self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+            self.writer_thread.start()
+
+    def should_capture(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def capture(self, prompt: Any, response: Any) -> None:
+        try:
+            self.queue.put_nowait((prompt, response))
+        except queue.Full:
+            logger.warning("Request capture queue is full, dropping capture")
+
+    def _write_loop(self) -> None:
+        while True:
+            prompt, response = self.queue.get()
+            try:
+                self._write(prompt, response)
+                self._rotate()
+            except Exception:
+                logger.exception("Failed to write request capture")
+
+    def _write(self, prompt: Any, response: Any) -> None:
+        request_dir = os.path.join(
+            self.capture_dir,
+            f"{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}",
+        )
+        os.makedirs(request_dir, exist_ok=True)
+
+        input_path = os.path.join(request_dir, "input.txt")
+        with open(input_path, "w", encoding="utf8") as file:
+            file.write(str(prompt))
+
+        output_path = os.path.join(request_dir, "output.json")
+        with open(output_path, "w", encoding="utf8") as file:
+            json.dump(response, file)
+
+    def _rotate(self) -> None:
+        request_dirs = sorted(os.listdir(self.capture_dir))
+        excess = max(0, len(request_dirs) - self.max_captures)
+        for request_dir in request_dirs[:excess]:
+            shutil.rmtree(
+                os.path.join(self.capture_dir, request_dir), ignore_errors=True
+            )
@@ -0,0 +1,37 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+class TokenCounter:
+    """LRU cache of token counts keyed by the hash of the counted text.
+
+    tokenize returns None when it cannot count the text, which is passed on
+    and not cached, so the text is tokenized again next time.
+    """
+
+    def __init__(self, tokenize: Callable[[str], Optional[int]], max_size: int = 4096):
+        self.tokenize = tokenize
+        self.max_size = max_size
+        self.cache: "OrderedDict[str, int]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def count(self, text: str) -> Optional[int]:
+        key = hashlib.md5(text.encode()).hexdigest()
+
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        token_count = self.tokenize(text)
+        if token_count is None:
+            return None
+
+        with self.lock:
+            self.cache[key] = token_count
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+        return token_count
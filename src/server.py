@@ -1,6 +1,8 @@
 import struct
+import sys
 import traceback
 import types
+import wave
 from flask import (
     Flask,
     Response,
@@ -14,6 +16,9 @@ import signal
 import shutil
 from dotenv import load_dotenv
 from amp.amp_manager.amp_manager import AmpManager
+from amp.audio.text_to_speech.wav_stream import streaming_wav_header
+from amp.image.image_generation.flux_manager import NUM_INFERENCE_STEPS
+from amp.image.image_generation.image_encoding import encode_image
 from messaging.telegram_manager import TelegramManager
 from web_management.gradio_interface_greeting import (
     get_current_name,
@@ -63,6 +68,18 @@ telegramManager = TelegramManager()
 app = Flask(__name__)
 
 
+def streaming_response(chunks, mimetype: str) -> Response:
+    """Returns a response that sends each chunk as soon as it is produced.
+
+    Without a known length the server uses chunked transfer encoding, and
+    proxies such as nginx are told not to buffer the response either.
+    """
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 @app.route("/greet")
 def greet():
     return f"Hello, {get_current_name()}!"
@@ -110,6 +127,54 @@ def get_available_models():
     return jsonify(response)
 
 
+@app.route("/get_model_status", methods=["GET"])
+def get_model_status():
+    result, response = ampManager.get_model_status()
+    if not result:
+        return jsonify({"error": response}), 400
+    return jsonify(response)
+
+
+@app.route("/get_resource_allocation", methods=["GET"])
+def get_resource_allocation():
+    result, response = ampManager.get_resource_allocation()
+    if not result:
+        return jsonify({"error": response}), 400
+    return jsonify(response)
+
+
+@app.route("/get_transcription_cache_stats", methods=["GET"])
+def get_transcription_cache_stats():
+    result, response = ampManager.get_transcription_cache_stats()
+    if not result:
+        return jsonify({"error": response}), 400
+    return jsonify(response)
+
+
+@app.route("/get_tts_cache_stats", methods=["GET"])
+def get_tts_cache_stats():
+    result, response = ampManager.get_tts_cache_stats()
+    if not result:
+        return jsonify({"error": response}), 400
+    return jsonify(response)
+
+
+@app.route("/get_prompt_cache_stats", methods=["GET"])
+def get_prompt_cache_stats():
+    result, response = ampManager.get_prompt_cache_stats()
+    if not result:
+        return jsonify({"error": response}), 400
+    return jsonify(response)
+
+
+@app.route("/get_image_cache_stats", methods=["GET"])
+def get_image_cache_stats():
+    result, response = ampManager.get_image_cache_stats()
+    if not result:
+        return jsonify({"error": response}), 400
+    return jsonify(response)
+
+
 @app.route("/get_model_info", methods=["POST"])
 def get_model_info():
     data = request.get_json()
@@ -155,12 +220,54 @@ def speech_to_text():
         if not result:
             logger.error(f"Speech to text error: {response}")
             return jsonify({"error": response}), 400
+
+        if isinstance(response, types.GeneratorType):
+            return streaming_response(transcript_events(response), "text/event-stream")
         return Response(response, mimetype="text/plain")
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/stt/stream", methods=["POST"])
+def speech_to_text_stream():
+    """Transcribes a raw audio request body while it is still being uploaded.
+
+    The body is sent as-is (e.g. with chunked transfer encoding) instead of
+    as a multipart form, and segments are returned as server-sent events.
+    Waitress receives the whole body before calling the app, so decoding only
+    overlaps the upload with SERVER.MODE set to "development".
+    """
+    try:
+        srt_mode = request.args.get("srt_mode", "false").lower() == "true"
+        result, response = ampManager.speech_to_text_stream(request.stream, srt_mode)
+
+        if not result:
+            return jsonify({"error": response}), 400
+
+        return streaming_response(transcript_events(response), "text/event-stream")
+    except Exception as e:
+        logger.exception("Error in /stt/stream endpoint")
+        return jsonify({"error": str(e)}), 500
+
+
+def transcript_events(pieces, openai_format: bool = False):
+    transcript = ""
+    for piece in pieces:
+        transcript += piece
+        if openai_format:
+            event = {"type": "transcript.text.delta", "delta": piece}
+        else:
+            event = {"text": piece}
+        yield f"data: {json.dumps(event)}\n\n"
+
+    if openai_format:
+        event = {"type": "transcript.text.done", "text": transcript.strip()}
+        yield f"data: {json.dumps(event)}\n\n"
+    else:
+        yield "data: [DONE]\n\n"
+
+
 @app.route("/tts", methods=["POST"])
 def tts() -> Response:
     try:
@@ -173,17 +280,15 @@ def tts() -> Response:
 
         clone_audio_data = clone_audio.read() if clone_audio else None
 
-        wav_file_paths = ampManager.text_to_speech_with_split(text, clone_audio_data)
+        wav_files = ampManager.text_to_speech_with_split(text, clone_audio_data)
 
         def generate():
-            for wav_file_path in wav_file_paths:
-                with open(wav_file_path, "rb") as wav_file:
-                    wav_data = wav_file.read()
-                    # Prefix each WAV file with its size using a 4-byte integer
-                    yield struct.pack("<I", len(wav_data))
-                    yield wav_data
-
-        return Response(generate(), mimetype="audio/wav")
+            for wav_data in wav_files:
+                # Prefix each WAV file with its size using a 4-byte integer
+                yield struct.pack("<I", len(wav_data))
+                yield wav_data
+
+        return streaming_response(generate(), "audio/wav")
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
@@ -191,28 +296,70 @@ def tts() -> Response:
 
 @app.route("/generate_image", methods=["POST"])
 def generate_image() -> Response:
+    """Generates an image, returned as base64 encoded PNG text by default.
+
+    With output_format (png, webp or jpeg) the raw image bytes are returned
+    instead, and with stream set previews are sent as server-sent events.
+    """
     try:
-        prompt = request.get_json().get("prompt")
-        width = request.get_json().get("width", 1024)
-        height = request.get_json().get("height", 1024)
-        seed = request.get_json().get("seed", None)
-        result_code, result = ampManager.generate_image(
-            prompt, width, height, seed=seed
+        data = request.get_json()
+        prompt = data.get("prompt")
+        width = data.get("width", 1024)
+        height = data.get("height", 1024)
+        seed = data.get("seed", None)
+        output_format = data.get("output_format")
+        quality = data.get("quality")
+
+        if data.get("stream", False):
+            result_code, result = ampManager.generate_image_stream(
+                prompt, width, height, seed=seed
+            )
+            if not result_code:
+                return jsonify({"error": result}), 400
+
+            return streaming_response(
+                image_events(result, output_format or "png", quality),
+                "text/event-stream",
+            )
+
+        result_code, result = ampManager.generate_images(
+            [prompt], width, height, seeds=[seed]
         )
 
         if not result_code:
             return jsonify({"error": result}), 400
 
-        buffered = BytesIO()
-        result.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        # The seed reproduces the image when sent with the same request
+        image, seed = result[0]
+        headers = {"X-Seed": str(seed)}
 
-        return Response(img_str, mimetype="text/plain")
+        if output_format:
+            image_data, mimetype = encode_image(image, output_format, quality)
+            return Response(image_data, mimetype=mimetype, headers=headers)
+
+        image_data, _mimetype = encode_image(image)
+        img_str = base64.b64encode(image_data).decode()
+        return Response(img_str, mimetype="text/plain", headers=headers)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+def image_events(events, output_format: str = "png", quality=None):
+    for kind, image, value in events:
+        image_data, _mimetype = encode_image(image, output_format, quality)
+        event = {"type": kind, "b64_json": base64.b64encode(image_data).decode()}
+        if kind == "preview":
+            event.update({"step": value, "total_steps": NUM_INFERENCE_STEPS})
+        else:
+            event["seed"] = value
+        yield f"data: {json.dumps(event)}\n\n"
+
+    yield "data: [DONE]\n\n"
+
+
 @app.route("/telegram_message", methods=["POST"])
 def send_telegram_message():
     try:
@@ -250,7 +397,7 @@ def chat_completions():
         if isinstance(
             response, types.GeneratorType
         ):  # Check if response is a generator
-            return Response(response, mimetype="text/event-stream")
+            return streaming_response(response, "text/event-stream")
 
         return jsonify(response), 200
 
@@ -268,27 +415,52 @@ def images_generations():
         size = data.get("size", "1024x1024")  # Default size
         quality = data.get("quality", "standard")  # Default quality
         n = data.get("n", 1)  # Default to 1 image
+        seeds = data.get("seeds")  # Optional list of n seeds
+        response_format = data.get("response_format", "b64_json")
+        output_format = data.get("output_format", "png")
+        output_compression = data.get("output_compression")
 
         if not prompt:
             return jsonify({"error": "Missing 'prompt' in the request."}), 400
 
+        if response_format not in ("b64_json", "binary"):
+            error = "response_format must be b64_json or binary."
+            return jsonify({"error": error}), 400
+        if response_format == "binary" and n != 1:
+            return jsonify({"error": "response_format binary requires n=1."}), 400
+
         width, height = map(int, size.split("x"))
 
-        images = []
-        for _ in range(n):
-            result_code, result = ampManager.generate_image(prompt, width, height)
+        # All n images are generated in batched pipeline calls
+        result_code, result = ampManager.generate_images(
+            [prompt], width, height, seeds=seeds, num_images_per_prompt=n
+        )
 
-            if not result_code:
-                return jsonify({"error": result}), 400
+        if not result_code:
+            return jsonify({"error": result}), 400
 
-            buffered = BytesIO()
-            result.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            images.append({"b64_json": img_str})
+        encoded = [
+            (encode_image(image, output_format, output_compression), seed)
+            for image, seed in result
+        ]
+
+        # A single image can be returned as is, without base64 and JSON
+        if response_format == "binary":
+            (image_data, mimetype), seed = encoded[0]
+            return Response(
+                image_data, mimetype=mimetype, headers={"X-Seed": str(seed)}
+            )
+
+        images = []
+        for (image_data, _mimetype), seed in encoded:
+            img_str = base64.b64encode(image_data).decode()
+            images.append({"b64_json": img_str, "seed": seed})
 
         response = {"created": int(time.time()), "data": images}
 
         return jsonify(response), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.exception("Error in /images/generations endpoint")
         return jsonify({"error": str(e)}), 500
@@ -310,6 +482,11 @@ def transcribe_audio():
             if not result:
                 return jsonify({"error": response}), 400
 
+            if isinstance(response, types.GeneratorType):
+                return streaming_response(
+                    transcript_events(response, openai_format=True),
+                    "text/event-stream",
+                )
             return jsonify({"text": response})
 
         return jsonify({"error": "File processing failed"}), 500
@@ -347,62 +524,42 @@ def text_to_speech():
 
         print("The input text is:", input_text)
 
-        wav_file_paths = ampManager.text_to_speech_with_split(
-            input_text, clone_audio_data
-        )
+        # "pcm" sends the raw samples, anything else a WAV stream
+        response_format = data.get("response_format", "wav")
+
+        wav_files = ampManager.text_to_speech_with_split(input_text, clone_audio_data)
 
         def generate():
-            # TODO: Might be able to use proper streaming with
-            # https://github.com/matatonic/openedai-speech/blob/main/speech.py
-            # or similar solution
-            total_audio_size = 0
-            audio_data = []
-
-            # First pass: collect all audio data and calculate total size
-            for wav_file_path in wav_file_paths:
-                with open(wav_file_path, "rb") as wav_file:
-                    wav_file.seek(0, 2)  # Seek to end
-                    file_size = wav_file.tell()
-                    wav_file.seek(0)  # Reset to beginning
-                    if total_audio_size == 0:
-                        # For first file, keep header
-                        audio_data.append(wav_file.read())
-                        total_audio_size = file_size - 44  # Subtract header size
-                    else:
-                        # For subsequent files, skip header
-                        wav_file.seek(44)
-                        audio_data.append(wav_file.read())
-                        total_audio_size += file_size - 44
-
-            # Update header with total size
-            header = bytearray(audio_data[0][:44])
-            struct.pack_into(
-                "<I", header, 4, total_audio_size + 36
-            )  # Update RIFF chunk size
-            struct.pack_into(
-                "<I", header, 40, total_audio_size
-            )  # Update data sub-chunk size
-
-            # Yield updated header
-            yield bytes(header)
-
-            # Yield audio data
-            for i, data in enumerate(audio_data):
-                if i == 0:
-                    yield data[44:]  # Skip original header for first file
-                else:
-                    yield data
-
-        headers = {
-            "Content-Type": "audio/wav",
-        }
-        return Response(generate(), headers=headers)
+            # The header is sent before the total length is known, so the first
+            # sentence can be played while the next ones are synthesized
+            header_sent = response_format == "pcm"
+            for wav_data in wav_files:
+                with wave.open(BytesIO(wav_data), "rb") as wav_file:
+                    if not header_sent:
+                        yield streaming_wav_header(
+                            wav_file.getnchannels(),
+                            wav_file.getsampwidth(),
+                            wav_file.getframerate(),
+                        )
+                        header_sent = True
+                    yield wav_file.readframes(wav_file.getnframes())
+
+        mimetype = "audio/pcm" if response_format == "pcm" else "audio/wav"
+        return streaming_response(generate(), mimetype)
 
     except Exception as e:
         logger.exception("Error in /audio/speech endpoint")
         return jsonify({"error": str(e)}), 500
 
 
+def get_max_upload_bytes() -> int:
+    # Bodies are spooled to a temporary file, so large videos don't use memory
+    max_upload_mb = int(os.getenv("SERVER.MAX_UPLOAD_MB", 0))
+    if max_upload_mb <= 0:
+        return sys.maxsize
+    return max_upload_mb * 1024 * 1024
+
+
 if __name__ == "__main__":
     try:
         # Start Gradio in a separate daemon thread
@@ -421,10 +578,31 @@ if __name__ == "__main__":
 
         signal.signal(signal.SIGINT, signal_handler)
 
-        app.run(debug=False, host="0.0.0.0", port=17173)
-        # Run Flask app using Waitress
-        logger.info("Starting Flask server with Waitress")
-        # serve(app, host="0.0.0.0", port=17173)
+        host = os.getenv("SERVER.HOST", "0.0.0.0")
+        port = int(os.getenv("SERVER.PORT", 17173))
+
+        if os.getenv("SERVER.MODE", "production") == "development":
+            app.run(debug=False, host=host, port=port, threaded=True)
+        else:
+            # Run Flask app using Waitress
+            logger.info("Starting Flask server with Waitress")
+            serve(
+                app,
+                host=host,
+                port=port,
+                # Every running request, e.g. a long generation, holds a thread
+                threads=int(os.getenv("SERVER.THREADS", 16)),
+                connection_limit=int(os.getenv("SERVER.CONNECTION_LIMIT", 100)),
+                # Idle keep-alive connections are closed after this many seconds
+                channel_timeout=int(os.getenv("SERVER.KEEPALIVE_TIMEOUT", 120)),
+                # Streaming handlers block once this much output is unsent, so
+                # a slow client slows down generation instead of filling memory
+                outbuf_high_watermark=int(
+                    os.getenv("SERVER.STREAM_BUFFER_BYTES", 1024 * 1024)
+                ),
+                max_request_body_size=get_max_upload_bytes(),
+                ident="AMP",
+            )
     except Exception as e:
         logger.exception(f"Unhandled exception in main: {str(e)}")
         traceback.print_exc()
@@ -26,7 +26,7 @@ def create_interface():
 
 def create_llamacpp_interface():
     current_llamacpp_model = gr.Textbox(
-        label="Current llama.cpp Model",
+        label="Loaded llama.cpp Models",
         value=lambda: get_current_llamacpp_model_name(),
         interactive=False,
     )
@@ -115,7 +115,10 @@ def create_flux_interface():
 def get_current_llamacpp_model_name():
     if amp_manager:
         return (
-            amp_manager.llamacpp_manager.active_models[0].get_model_path()
+            ", ".join(
+                model.get_model_path()
+                for model in amp_manager.llamacpp_manager.active_models
+            )
             if amp_manager.llamacpp_manager.active_models
             else "No model loaded"
         )
@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from amp.language_models.providers.llamacpp import llamacpp_manager
+from amp.language_models.providers.llamacpp.llamacpp_manager import LlamaCppManager
+from amp.language_models.providers.llamacpp.model_load import ModelLoad
+
+
+class FakePopen:
+    def __init__(self, *args, **kwargs):
+        self.stdout = None
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+    def kill(self):
+        self.terminated = True
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """A LlamaCppManager whose models load instantly without a llama-server."""
+
+    def start_ready(self, popen, load_timeout, on_failure):
+        self.popen = popen
+        self._finish()
+
+    monkeypatch.setattr(llamacpp_manager.subprocess, "Popen", FakePopen)
+    monkeypatch.setattr(ModelLoad, "start", start_ready)
+    monkeypatch.setattr(
+        LlamaCppManager,
+        "get_available_models",
+        lambda self: ["a.gguf", "b.gguf", "c.gguf"],
+    )
+    monkeypatch.setattr(LlamaCppManager, "get_model_size_mb", lambda self, path: 100)
+    manager = LlamaCppManager("llama-server", 18000)
+    yield manager
+    manager.loads.clear()
+
+
+@pytest.fixture
+def wait_for():
+    def wait(condition, timeout=2.0):
+        deadline = time.time() + timeout
+        while not condition():
+            assert time.time() < deadline, "condition not met in time"
+            time.sleep(0.01)
+
+    return wait
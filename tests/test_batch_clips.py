@@ -0,0 +1,83 @@
+from amp.audio.speech_to_text.batch_clips import (
+    TranscriptSegment,
+    merge_clips,
+    split_segments,
+)
+
+SAMPLING_RATE = 16000
+
+
+def test_merge_clips_joins_fragments_up_to_max_length():
+    clips = [
+        {"start": 0, "end": 16000},
+        {"start": 32000, "end": 48000},
+        {"start": 500000, "end": 560000},
+        {"start": 570000, "end": 580000},
+    ]
+
+    chunks = merge_clips(clips, 30 * SAMPLING_RATE)
+
+    assert chunks == [
+        {"start": 0, "end": 48000},
+        {"start": 500000, "end": 580000},
+    ]
+
+
+def test_merge_clips_does_not_modify_input():
+    clips = [{"start": 0, "end": 10}, {"start": 20, "end": 30}]
+
+    merge_clips(clips, 100)
+
+    assert clips == [{"start": 0, "end": 10}, {"start": 20, "end": 30}]
+
+
+def test_split_segments_maps_batched_uploads_to_their_jobs():
+    # A 10 second upload followed by a 20 second upload
+    job_offsets = [0, 10 * SAMPLING_RATE]
+    segments = [
+        TranscriptSegment(1.0, 3.0, "first upload"),
+        TranscriptSegment(8.5, 10.2, "end of first upload"),
+        TranscriptSegment(11.0, 14.5, "second upload"),
+        TranscriptSegment(25.0, 29.0, "end of second upload"),
+    ]
+
+    job_segments = split_segments(segments, job_offsets, SAMPLING_RATE)
+
+    assert job_segments == [
+        [
+            TranscriptSegment(1.0, 3.0, "first upload"),
+            TranscriptSegment(8.5, 10.2, "end of first upload"),
+        ],
+        [
+            TranscriptSegment(1.0, 4.5, "second upload"),
+            TranscriptSegment(15.0, 19.0, "end of second upload"),
+        ],
+    ]
+
+
+def test_split_segments_keeps_jobs_without_speech_empty():
+    job_offsets = [0, 5 * SAMPLING_RATE, 10 * SAMPLING_RATE]
+    segments = [TranscriptSegment(11.0, 12.0, "third upload")]
+
+    job_segments = split_segments(segments, job_offsets, SAMPLING_RATE)
+
+    assert job_segments == [[], [], [TranscriptSegment(1.0, 2.0, "third upload")]]
+
+
+def test_split_segments_keeps_segments_within_a_chunk():
+    # Both uploads are merged into one 30 second chunk, decoded into sentences
+    job_offsets = [0, 12 * SAMPLING_RATE]
+    segments = [
+        TranscriptSegment(0.5, 4.0, "first sentence"),
+        TranscriptSegment(4.2, 9.0, "second sentence"),
+        TranscriptSegment(13.0, 18.0, "third sentence"),
+        TranscriptSegment(18.5, 25.0, "fourth sentence"),
+    ]
+
+    job_segments = split_segments(segments, job_offsets, SAMPLING_RATE)
+
+    assert [len(segments) for segments in job_segments] == [2, 2]
+    assert job_segments[1] == [
+        TranscriptSegment(1.0, 6.0, "third sentence"),
+        TranscriptSegment(6.5, 13.0, "fourth sentence"),
+    ]
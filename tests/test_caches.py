@@ -0,0 +1,100 @@
+import os
+import wave
+from io import BytesIO
+
+from amp.audio.speech_to_text.transcription_cache import TranscriptionCache
+from amp.audio.text_to_speech.audio_cache import AudioCache
+from amp.image.image_generation.image_cache import ImageCache
+
+
+def make_wav(frames: int) -> bytes:
+    output = BytesIO()
+    with wave.open(output, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(24000)
+        wav_file.writeframes(b"\0\0" * frames)
+    return output.getvalue()
+
+
+def test_transcription_cache_evicts_least_recently_used(tmp_path):
+    cache = TranscriptionCache(str(tmp_path / "transcripts.db"), max_bytes=10)
+
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+    cache.put("c", "cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+    statistics = cache.get_statistics()
+    assert statistics["entries"] == 2
+    assert statistics["bytes"] == 8
+    assert (statistics["hits"], statistics["misses"]) == (3, 1)
+
+
+def test_transcription_cache_skips_entries_larger_than_budget(tmp_path):
+    cache = TranscriptionCache(str(tmp_path / "transcripts.db"), max_bytes=4)
+
+    cache.put("a", "too long")
+
+    assert cache.get("a") is None
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = TranscriptionCache(str(tmp_path / "transcripts.db"), max_bytes=0)
+
+    cache.put("a", "aaaa")
+
+    assert cache.get("a") is None
+    assert not os.path.exists(tmp_path / "transcripts.db")
+    assert cache.get_statistics()["enabled"] is False
+
+
+def test_image_cache_removes_evicted_files(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=250)
+
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    cache.get("a")
+    cache.put("c", b"c" * 100)
+
+    assert cache.get("a") == b"a" * 100
+    assert cache.get("b") is None
+    assert cache.get("c") == b"c" * 100
+    assert not os.path.exists(tmp_path / "b.png")
+
+
+def test_image_cache_treats_deleted_file_as_miss(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=1000)
+    cache.put("a", b"image")
+
+    os.remove(tmp_path / "a.png")
+
+    assert cache.get("a") is None
+    assert cache.get_statistics()["entries"] == 0
+
+
+def test_audio_cache_round_trips_wav(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1024 * 1024)
+    wav_data = make_wav(2400)
+
+    cache.put("speech", wav_data)
+
+    assert cache.get("speech") == wav_data
+    assert cache.get_statistics()["storage_format"] == "wav"
+
+
+def test_cache_keys_depend_on_every_setting():
+    key = ImageCache.make_key("flux", "a cat", 1024, 1024, 1, 3.5, 4)
+
+    assert key == ImageCache.make_key("flux", "a cat", 1024, 1024, 1, 3.5, 4)
+    assert key != ImageCache.make_key("flux", "a cat", 1024, 1024, 2, 3.5, 4)
+    assert key != ImageCache.make_key("flux", "a cat", 512, 1024, 1, 3.5, 4)
+
+
+def test_streamed_transcripts_have_their_own_key():
+    key = TranscriptionCache.make_key("hash", "base.en", False, "en")
+
+    assert key != TranscriptionCache.make_key("hash", "base.en", False, "en", True)
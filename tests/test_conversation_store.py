@@ -0,0 +1,42 @@
+from amp.language_models.conversation_store import ConversationStore
+from amp.language_models.model_conversation import ModelConversation
+
+
+def create_store(tmp_path, **kwargs):
+    return ConversationStore(db_path=str(tmp_path / "conversations.db"), **kwargs)
+
+
+def test_get_or_create_keeps_existing_messages(tmp_path):
+    store = create_store(tmp_path)
+    store.get_or_create("a", lambda: ModelConversation("model.gguf"))
+    store["a"].add_user_message("hello")
+
+    reopened = create_store(tmp_path)
+    conversation = reopened.get_or_create("a", lambda: ModelConversation("other.gguf"))
+
+    assert conversation.get_model_path() == "model.gguf"
+    assert [message.content for message in conversation.messages] == ["hello"]
+
+
+def test_checked_out_conversation_is_not_evicted(tmp_path):
+    store = create_store(tmp_path, max_in_memory=1)
+
+    with store.checkout("a", lambda: ModelConversation("model.gguf")) as held:
+        store.get_or_create("b", lambda: ModelConversation("model.gguf"))
+        held.add_user_message("hello")
+
+        assert store.get("a") is held
+
+    store.get("b")
+    reloaded = store.get("a")
+    assert reloaded is not held
+    assert [message.content for message in reloaded.messages] == ["hello"]
+
+
+def test_checked_out_conversation_survives_ttl(tmp_path):
+    store = create_store(tmp_path, ttl_seconds=0)
+
+    with store.checkout("a", lambda: ModelConversation("model.gguf")) as held:
+        assert store.get("a") is held
+
+    assert store.get("a") is not held
@@ -0,0 +1,92 @@
+import threading
+
+from amp.amp_manager.request_scheduler import RequestScheduler
+
+
+def test_unloading_busy_model_does_not_block_other_models(manager, wait_for):
+    scheduler = RequestScheduler(manager)
+    scheduler.acquire("a.gguf")
+
+    unloader = threading.Thread(target=manager.unload_model, args=("a.gguf",))
+    unloader.start()
+    wait_for(lambda: manager.loads["a.gguf"].draining)
+
+    # The manager lock is free while a.gguf drains
+    model = manager.get_model("b.gguf")
+    assert model.get_model_path() == "b.gguf"
+    assert "a.gguf" in manager.loads
+
+    scheduler.release("a.gguf")
+    unloader.join(timeout=2)
+    assert not unloader.is_alive()
+    assert "a.gguf" not in manager.loads
+
+
+def test_requesting_draining_model_cancels_unload(manager, wait_for):
+    scheduler = RequestScheduler(manager)
+    scheduler.acquire("a.gguf")
+
+    unloader = threading.Thread(target=manager.unload_model, args=("a.gguf",))
+    unloader.start()
+    wait_for(lambda: manager.loads["a.gguf"].draining)
+
+    manager.request_model("a.gguf")
+    scheduler.release("a.gguf")
+    unloader.join(timeout=2)
+
+    assert "a.gguf" in manager.loads
+    assert not manager.loads["a.gguf"].draining
+
+
+def test_evicting_busy_model_defers_new_process(manager, wait_for):
+    manager.max_loaded_models = 1
+    scheduler = RequestScheduler(manager)
+    scheduler.acquire("a.gguf")
+
+    future = manager.request_model("b.gguf")
+
+    assert not future.done()
+    assert manager.loads["b.gguf"].popen is None
+    assert manager.loads["a.gguf"].draining
+
+    scheduler.release("a.gguf")
+    assert future.result(timeout=2).get_model_path() == "b.gguf"
+    wait_for(lambda: "a.gguf" not in manager.loads)
+
+
+def test_evicting_idle_model_is_immediate(manager):
+    manager.max_loaded_models = 1
+    manager.get_model("a.gguf")
+
+    assert manager.get_model("b.gguf").get_model_path() == "b.gguf"
+    assert list(manager.loads) == ["b.gguf"]
+
+
+def test_victim_requested_again_is_not_evicted(manager):
+    scheduler = RequestScheduler(manager)
+    scheduler.acquire("c.gguf")
+    scheduler.acquire("a.gguf")
+
+    future = manager.request_model("b.gguf")
+    assert manager.loads["c.gguf"].draining
+
+    # c.gguf is wanted again, and unloading a.gguf makes room for b.gguf instead
+    manager.request_model("c.gguf")
+    scheduler.release("a.gguf")
+    manager.unload_model("a.gguf")
+    scheduler.release("c.gguf")
+
+    assert future.result(timeout=2).get_model_path() == "b.gguf"
+    assert "c.gguf" in manager.loads
+    assert not manager.loads["c.gguf"].popen.terminated
+
+
+def test_unload_if_idle_never_waits_for_busy_models(manager):
+    scheduler = RequestScheduler(manager)
+    scheduler.acquire("a.gguf")
+    manager.get_model("b.gguf")
+
+    assert not manager.unload_if_idle("a.gguf")
+    assert manager.unload_if_idle("b.gguf")
+    assert list(manager.loads) == ["a.gguf"]
+    assert not manager.loads["a.gguf"].draining
@@ -0,0 +1,50 @@
+from amp.language_models.model_conversation import (
+    PROMPT_OVERHEAD_TOKENS,
+    ModelConversation,
+)
+
+
+class FakeModel:
+    def __init__(self, context_window_size: int):
+        self.context_window_size = context_window_size
+
+    def get_context_window_size(self) -> int:
+        return self.context_window_size
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.encode())
+
+
+def fit(conversation, context_tokens):
+    segments = [message.content for message in conversation.messages]
+    model = FakeModel(context_tokens + PROMPT_OVERHEAD_TOKENS)
+    indices = list(range(len(segments)))
+    return conversation._fit_to_context(model, indices, segments, 0)
+
+
+def test_fit_to_context_keeps_all_system_messages():
+    conversation = ModelConversation("model.gguf")
+    conversation.add_system_message("s1")
+    conversation.add_user_message("u1")
+    conversation.add_assistant_message("a1")
+    conversation.add_system_message("s2")
+    conversation.add_user_message("u2")
+
+    assert fit(conversation, 8) == [0, 2, 3, 4]
+
+
+def test_fit_to_context_keeps_latest_message_over_budget():
+    conversation = ModelConversation("model.gguf")
+    conversation.add_system_message("s1")
+    conversation.add_user_message("u1")
+    conversation.add_user_message("a long message")
+
+    assert fit(conversation, 4) == [0, 2]
+
+
+def test_fit_to_context_counts_multibyte_text():
+    conversation = ModelConversation("model.gguf")
+    conversation.add_user_message("u1")
+    conversation.add_user_message("日本語")
+
+    assert fit(conversation, 9) == [1]
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from amp.amp_manager.request_scheduler import RequestScheduler
+
+
+def acquire_in_thread(scheduler, model_path):
+    acquired = threading.Event()
+
+    def run():
+        scheduler.acquire(model_path)
+        acquired.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return acquired
+
+
+def test_requests_are_limited_to_parallel_slots(manager, wait_for):
+    manager.parallel_slots = 1
+    scheduler = RequestScheduler(manager)
+    scheduler.acquire("a.gguf")
+
+    acquired = acquire_in_thread(scheduler, "a.gguf")
+    wait_for(lambda: scheduler.get_in_flight_count("a.gguf") == 2)
+    assert not acquired.is_set()
+
+    scheduler.release("a.gguf")
+    assert acquired.wait(timeout=2)
+    assert scheduler.get_in_flight_count("a.gguf") == 1
+
+
+def test_full_queue_rejects_requests(manager, wait_for):
+    manager.parallel_slots = 1
+    scheduler = RequestScheduler(manager, max_queue_size=1)
+    scheduler.acquire("a.gguf")
+    acquire_in_thread(scheduler, "a.gguf")
+    wait_for(lambda: scheduler.get_in_flight_count("a.gguf") == 2)
+
+    with pytest.raises(RuntimeError):
+        scheduler.acquire("a.gguf")
+
+    # Other models have their own queue
+    assert scheduler.acquire("b.gguf").get_model_path() == "b.gguf"
+
+
+def test_unknown_model_is_rejected(manager):
+    scheduler = RequestScheduler(manager)
+
+    with pytest.raises(ValueError):
+        scheduler.acquire("missing.gguf")
+    assert scheduler.is_idle("missing.gguf")
+
+
+def test_wait_until_idle_returns_after_release(manager):
+    scheduler = RequestScheduler(manager)
+    scheduler.acquire("a.gguf")
+    assert not scheduler.is_idle("a.gguf")
+
+    waiter = threading.Thread(target=scheduler.wait_until_idle, args=("a.gguf",))
+    waiter.start()
+    waiter.join(timeout=0.1)
+    assert waiter.is_alive()
+
+    scheduler.release("a.gguf")
+    waiter.join(timeout=2)
+    assert not waiter.is_alive()
+    assert scheduler.is_idle("a.gguf")
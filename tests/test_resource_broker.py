@@ -0,0 +1,70 @@
+from amp.amp_manager.resource_broker import ResourceBroker
+
+
+class FakeModel:
+    def __init__(self, size_mb: int, loaded: bool = True):
+        self.size_mb = size_mb
+        self.loaded = loaded
+
+    def unload(self):
+        self.loaded = False
+
+
+def register(broker, name, model, priority=0, is_idle=None):
+    broker.register(
+        name,
+        lambda: model.size_mb,
+        lambda: model.loaded,
+        model.unload,
+        priority=priority,
+        is_idle=is_idle,
+    )
+
+
+def test_reserve_evicts_lowest_priority_first():
+    broker = ResourceBroker(budget_mb=1000)
+    flux, xtts, whisper = FakeModel(600), FakeModel(300), FakeModel(300, False)
+    register(broker, "flux", flux, priority=1)
+    register(broker, "xtts", xtts, priority=2)
+    register(broker, "whisper", whisper, priority=2)
+
+    broker.reserve("whisper")
+
+    assert not flux.loaded
+    assert xtts.loaded
+
+
+def test_reserve_never_evicts_resources_in_use():
+    broker = ResourceBroker(budget_mb=1000)
+    flux, whisper = FakeModel(800), FakeModel(300, False)
+    register(broker, "flux", flux)
+    register(broker, "whisper", whisper)
+
+    with broker.use("flux"):
+        broker.reserve("whisper")
+        assert flux.loaded
+
+
+def test_unload_if_idle_skips_resources_in_use():
+    broker = ResourceBroker()
+    xtts = FakeModel(300)
+    register(broker, "xtts", xtts)
+
+    with broker.use("xtts"):
+        assert not broker.unload_if_idle("xtts")
+        assert xtts.loaded
+
+    assert broker.unload_if_idle("xtts")
+    assert not xtts.loaded
+
+
+def test_unload_if_idle_respects_is_idle():
+    broker = ResourceBroker()
+    model = FakeModel(4000)
+    busy = [True]
+    register(broker, "llamacpp:a.gguf", model, is_idle=lambda: not busy[0])
+
+    assert not broker.unload_if_idle("llamacpp:a.gguf")
+    busy[0] = False
+    assert broker.unload_if_idle("llamacpp:a.gguf")
+    assert not model.loaded
@@ -0,0 +1,42 @@
+from amp.language_models.providers.llamacpp.slot_manager import SlotManager
+
+
+def test_key_reuses_its_slot_when_free():
+    slots = SlotManager(2)
+    slot_a, _ = slots.acquire("a")
+    slots.release(slot_a)
+    slot_b, _ = slots.acquire("b")
+    slots.release(slot_b)
+
+    assert slots.acquire("a") == (slot_a, "a")
+
+
+def test_least_recently_used_slot_is_taken_over():
+    slots = SlotManager(2)
+    slot_a, _ = slots.acquire("a")
+    slots.release(slot_a)
+    slot_b, _ = slots.acquire("b")
+    slots.release(slot_b)
+
+    assert slots.acquire("c") == (slot_a, "a")
+
+
+def test_key_owns_one_slot_when_its_slot_is_busy():
+    slots = SlotManager(2)
+    first, _ = slots.acquire("a")
+    second, previous_key = slots.acquire("a")
+
+    assert second != first
+    assert previous_key is None
+    assert list(slots.owners.values()).count("a") == 1
+
+    slots.release(first)
+    slots.release(second)
+    assert slots.acquire("b") == (first, None)
+
+
+def test_all_slots_busy_returns_no_slot():
+    slots = SlotManager(1)
+    slots.acquire("a")
+
+    assert slots.acquire("b") == (-1, None)
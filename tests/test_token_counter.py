@@ -0,0 +1,23 @@
+from amp.language_models.token_counter import TokenCounter
+
+
+def test_counts_are_cached():
+    calls = []
+
+    def tokenize(text):
+        calls.append(text)
+        return len(text)
+
+    counter = TokenCounter(tokenize)
+
+    assert counter.count("hello") == 5
+    assert counter.count("hello") == 5
+    assert calls == ["hello"]
+
+
+def test_failed_counts_are_not_cached():
+    results = [None, 3]
+    counter = TokenCounter(lambda text: results.pop(0))
+
+    assert counter.count("hello") is None
+    assert counter.count("hello") == 3